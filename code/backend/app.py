@@ -1,65 +1,214 @@
 import os
-import psycopg2
+import json
 import psycopg2.extras
-from dotenv import load_dotenv
-from sentence_transformers import SentenceTransformer
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
+import db_pool
+from vector_index import apply_search_settings
+from query_cache import QueryEmbeddingCache, vector_literal
+from response_cache import ResponseCache, recommendation_cache_key
+from ranking import rank_businesses, businesses_payload
+from version_watcher import watcher as data_versions
+from snapshot_engine import SnapshotEngine
+from encode_batcher import EncodeBatcher
+from model_loader import LazyModel
+from fault_catalog import FaultPartsCatalog, FAULT_PARTS_MAX_AGE
+from seasonal_tips_app import tips_bp, seasonal_tips
 
-load_dotenv()
-DB_HOST = os.getenv("DB_HOST")
-DB_NAME = os.getenv("DB_NAME")
-DB_USER = os.getenv("DB_USER")
-DB_PASSWORD = os.getenv("DB_PASSWORD")
-
-model = SentenceTransformer('all-MiniLM-L6-v2')
+# Loaded on first semantic query (or by the warm-up thread), so the app is ready to serve at once
+model = LazyModel()
+if os.getenv("MODEL_WARMUP", "1") == "1":
+    model.warm_up_async()
 
 app = Flask(__name__)
+# /api/maintenance_tips is served from this process instead of a second app on port 5001
+app.register_blueprint(tips_bp)
+# Load the tips now, so the first request does not pay for it
+seasonal_tips.refresh()
+query_cache = QueryEmbeddingCache()
+# Concurrent query encodes are grouped into one model.encode call
+encode_batcher = EncodeBatcher(lambda texts: model.encode(texts, batch_size=len(texts)))
+response_cache = ResponseCache()
+fault_catalog = FaultPartsCatalog()
+
+# Recommendations depend on these batch outputs; a bump drops every cached response
+RECOMMENDATION_DATASETS = ("business_stats", "embeddings", "composite_scores")
+data_versions.subscribe(RECOMMENDATION_DATASETS, response_cache.clear)
+
+# fault_parts.py bumps this after regenerating the catalog
+data_versions.subscribe(("fault_parts",), fault_catalog.refresh)
+
+def recommendation_versions():
+    return tuple(data_versions.get(name) for name in RECOMMENDATION_DATASETS)
+
+# Default ANN knobs; a request can override them with ?ef_search= / ?probes=
+DEFAULT_EF_SEARCH = int(os.getenv("VECTOR_EF_SEARCH", "100"))
+DEFAULT_PROBES = int(os.getenv("VECTOR_PROBES", "10"))
+MAX_SEARCH_KNOB = 1000
+# "business": one ANN search over per-business centroid embeddings (built by scripts/business_embeddings.py)
+# "reviews": nearest reviews deduplicated into businesses
+SEMANTIC_SEARCH_LEVEL = os.getenv("SEMANTIC_SEARCH_LEVEL", "reviews")
+# Nearest reviews fetched by the review-level semantic search (ef_search is raised to at least this)
+SIMILAR_REVIEW_LIMIT = 100
+# Nearest businesses considered before ranking by distance/stars
+SIMILAR_BUSINESS_LIMIT = int(os.getenv("SIMILAR_BUSINESS_LIMIT", "20"))
+RESULT_LIMIT = 7
+# Location ranking: the nearest SPATIAL_CANDIDATES shops (KNN on the GiST index) are scored
+# by rating and closeness, with closeness falling to 0 at the radius (or DISTANCE_SCALE_M)
+SPATIAL_CANDIDATES = int(os.getenv("SPATIAL_CANDIDATES", "50"))
+DISTANCE_SCALE_M = float(os.getenv("DISTANCE_SCALE_M", "25000"))
+RATING_WEIGHT = float(os.getenv("RATING_WEIGHT", "0.6"))
+DISTANCE_WEIGHT = float(os.getenv("DISTANCE_WEIGHT", "0.4"))
+# "composite": fault searches rank every shop that repaired the fault by its composite score
+# (business_fault_scores, built by scripts/composite_scores.py); "best_business": shops whose
+# most frequent fault it is, ranked by rating. Until the scores table exists, composite falls
+# back to best_business.
+FAULT_RANKING = os.getenv("FAULT_RANKING", "composite")
+RANKING = {
+    "fault_ranking": FAULT_RANKING,
+    "result_limit": RESULT_LIMIT,
+    "similar_business_limit": SIMILAR_BUSINESS_LIMIT,
+    "spatial_candidates": SPATIAL_CANDIDATES,
+    "distance_scale_m": DISTANCE_SCALE_M,
+    "rating_weight": RATING_WEIGHT,
+    "distance_weight": DISTANCE_WEIGHT,
+}
+# Serve recommendations from an in-memory snapshot of the business table when it is fresh
+USE_SNAPSHOT_ENGINE = os.getenv("USE_SNAPSHOT_ENGINE", "0") == "1"
+
+composite_scores_ready = False
+
+def check_composite_scores(name=None, version=None):
+    """
+    Record whether business_fault_scores exists; called at startup and when its data version changes.
+    """
+    global composite_scores_ready
+    try:
+        ready = db_pool.table_exists("business_fault_scores")
+    except Exception as e:
+        print(f"composite scores check failed: {e}")
+        return
+    if ready != composite_scores_ready:
+        composite_scores_ready = ready
+        # Responses cached meanwhile were ranked the other way
+        response_cache.clear()
+
+def use_composite_ranking():
+    return FAULT_RANKING == "composite" and composite_scores_ready
+
+check_composite_scores()
+data_versions.subscribe(("composite_scores",), check_composite_scores)
 
-def get_db_conn():
-    conn = psycopg2.connect(
-        host=DB_HOST,
-        database=DB_NAME,
-        user=DB_USER,
-        password=DB_PASSWORD
+snapshot_engine = SnapshotEngine(RECOMMENDATION_DATASETS, FAULT_RANKING) if USE_SNAPSHOT_ENGINE else None
+if snapshot_engine is not None:
+    data_versions.subscribe(
+        RECOMMENDATION_DATASETS,
+        lambda name, version: snapshot_engine.request_reload(recommendation_versions)
     )
-    return conn
+    snapshot_engine.request_reload(recommendation_versions)
+data_versions.start()
 
 @app.route('/api/fault-parts', methods=['GET'])
 def get_fault_parts():
     """
-    Return the list of fault locations to the front end.
+    Return the list of fault locations to the front end, from memory.
+    Clients that send the current ETag in If-None-Match get an empty 304.
     """
-    conn = get_db_conn()
-    cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
-    cur.execute("SELECT part_name FROM fault_parts ORDER BY part_name;")
-    rows = cur.fetchall()
-    cur.close()
-    conn.close()
-
-    parts = [r['part_name'] for r in rows] if rows else []
-    return jsonify({"fault_parts": parts})
+    body, etag = fault_catalog.get()
+    not_modified = request.if_none_match.contains(etag)
+    fault_catalog.record(not_modified)
+    response = Response(status=304) if not_modified else Response(body, mimetype="application/json")
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = f"public, max-age={FAULT_PARTS_MAX_AGE}"
+    return response
 
 def get_business_ids_by_fault(conn, fault_id):
     cur = conn.cursor()
-    cur.execute("""
+    db_pool.execute_prepared(cur, "business_ids_by_fault", """
         SELECT business_id
         FROM business
-        WHERE best_business = %s
+        WHERE best_business = $1
     """, (fault_id,))
     rows = cur.fetchall()
     cur.close()
     return [r[0] for r in rows] if rows else []
 
-def get_business_ids_by_similarity(conn, query_text):
-    user_vec = model.encode(query_text)
-    user_vec_str = "[" + ",".join(str(x) for x in user_vec) + "]"
+def get_top_businesses_by_fault(conn, fault_id):
+    """
+    Highest composite scores for a fault, read from the top-k index.
+    """
+    cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
+    db_pool.execute_prepared(cur, "top_businesses_by_fault", """
+        SELECT b.name, b.stars, b.address, ST_AsGeoJSON(b.geom) AS geom
+        FROM business_fault_scores s
+        JOIN business b ON b.business_id = s.business_id
+        WHERE s.fault_type = $1
+        ORDER BY s.composite_score DESC
+        LIMIT $2
+    """, (fault_id, RESULT_LIMIT))
+    rows = cur.fetchall()
+    cur.close()
+    return [dict(row) for row in rows]
+
+def get_nearest_businesses_by_fault(conn, fault_id, user_lat, user_lon, radius_m=None):
+    """
+    Nearest shops that repaired the fault, ranked like get_nearest_businesses but with the
+    composite score (relative to the best nearby shop) in place of the rating.
+    """
     cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
+    cur.execute("""
+        WITH point AS (
+            SELECT ST_SetSRID(ST_MakePoint(%(lon)s, %(lat)s), 4326)::geography AS location
+        ),
+        nearest AS (
+            SELECT b.name, b.stars, b.address, b.geom, s.composite_score, b.geom <-> p.location AS distance
+            FROM business_fault_scores s
+            JOIN business b ON b.business_id = s.business_id
+            CROSS JOIN point p
+            WHERE s.fault_type = %(fault)s
+              AND (%(radius)s IS NULL OR ST_DWithin(b.geom, p.location, %(radius)s))
+            ORDER BY b.geom <-> p.location
+            LIMIT %(candidates)s
+        )
+        SELECT name, stars, address, ST_AsGeoJSON(geom) AS geom, distance,
+               %(rating_weight)s * COALESCE(composite_score / NULLIF(MAX(composite_score) OVER (), 0), 0)
+               + %(distance_weight)s * (1 - LEAST(distance / %(scale)s, 1)) AS rank_score
+        FROM nearest
+        ORDER BY rank_score DESC, distance
+        LIMIT %(limit)s;
+    """, {
+        "lon": user_lon,
+        "lat": user_lat,
+        "fault": fault_id,
+        "radius": radius_m,
+        "candidates": SPATIAL_CANDIDATES,
+        "rating_weight": RATING_WEIGHT,
+        "distance_weight": DISTANCE_WEIGHT,
+        "scale": radius_m or DISTANCE_SCALE_M,
+        "limit": RESULT_LIMIT
+    })
+    rows = cur.fetchall()
+    cur.close()
+    return [dict(row) for row in rows]
+
+def encode_query(query_text):
+    """
+    Float32 embedding of the query; repeated phrases are served from the cache.
+    SQL callers pass it as vector_literal(...)::vector.
+    """
+    return query_cache.get_or_encode(query_text, encode_batcher.encode)
+
+def get_business_ids_by_similarity(conn, query_text, ef_search=DEFAULT_EF_SEARCH, probes=DEFAULT_PROBES):
+    user_vec = encode_query(query_text)
+    cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
+    # Knobs only last for this transaction, so pooled connections are not affected
+    apply_search_settings(cur, ef_search, probes, limit=SIMILAR_REVIEW_LIMIT)
+    # Cosine distance matches the MiniLM embeddings and the vector_cosine_ops ANN index
     cur.execute("""
         SELECT business_id
         FROM reviews
-        ORDER BY embedding <-> %s
-        LIMIT 100;
-    """, (user_vec_str,))
+        ORDER BY embedding <=> %s::vector
+        LIMIT %s;
+    """, (vector_literal(user_vec), SIMILAR_REVIEW_LIMIT))
     rows = cur.fetchall()
     cur.close()
     if not rows:
@@ -67,6 +216,66 @@ def get_business_ids_by_similarity(conn, query_text):
     biz_ids = {r['business_id'] for r in rows}
     return list(biz_ids)
 
+def get_business_ids_by_embedding(conn, query_text, ef_search=DEFAULT_EF_SEARCH):
+    """
+    One ANN search over the per-business centroid embeddings, instead of over every review.
+    """
+    user_vec = encode_query(query_text)
+    cur = conn.cursor()
+    apply_search_settings(cur, ef_search=ef_search, limit=SIMILAR_BUSINESS_LIMIT)
+    cur.execute("""
+        SELECT business_id
+        FROM business_embeddings
+        ORDER BY embedding <=> %s::vector
+        LIMIT %s;
+    """, (vector_literal(user_vec), SIMILAR_BUSINESS_LIMIT))
+    rows = cur.fetchall()
+    cur.close()
+    return [r[0] for r in rows]
+
+def recommendation_key(fault_id, query_text, user_lat, user_lon, ef_search, probes, radius_m=None):
+    return recommendation_cache_key(fault_id, query_text, user_lat, user_lon, ef_search, probes, radius_m,
+                                    recommendation_versions())
+
+def get_nearest_businesses(conn, business_ids, user_lat, user_lon, radius_m=None):
+    """
+    KNN nearest shops among business_ids (optionally within radius_m metres),
+    ranked in SQL by a weighted mix of rating and closeness.
+    """
+    cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
+    cur.execute("""
+        WITH point AS (
+            SELECT ST_SetSRID(ST_MakePoint(%(lon)s, %(lat)s), 4326)::geography AS location
+        ),
+        nearest AS (
+            SELECT b.name, b.stars, b.address, b.geom, b.geom <-> p.location AS distance
+            FROM business b, point p
+            WHERE b.business_id = ANY(%(ids)s)
+              AND (%(radius)s IS NULL OR ST_DWithin(b.geom, p.location, %(radius)s))
+            ORDER BY b.geom <-> p.location
+            LIMIT %(candidates)s
+        )
+        SELECT name, stars, address, ST_AsGeoJSON(geom) AS geom, distance,
+               %(rating_weight)s * COALESCE(stars, 0) / 5.0
+               + %(distance_weight)s * (1 - LEAST(distance / %(scale)s, 1)) AS rank_score
+        FROM nearest
+        ORDER BY rank_score DESC, distance
+        LIMIT %(limit)s;
+    """, {
+        "lon": user_lon,
+        "lat": user_lat,
+        "ids": business_ids,
+        "radius": radius_m,
+        "candidates": SPATIAL_CANDIDATES,
+        "rating_weight": RATING_WEIGHT,
+        "distance_weight": DISTANCE_WEIGHT,
+        "scale": radius_m or DISTANCE_SCALE_M,
+        "limit": RESULT_LIMIT
+    })
+    rows = cur.fetchall()
+    cur.close()
+    return [dict(row) for row in rows]
+
 def get_business_details_with_location(conn, business_ids):
     if not business_ids:
         return []
@@ -97,71 +306,92 @@ def recommend_businesses():
     user_lon = request.args.get('user_lon', type=float)
     fault_id = request.args.get('fault_id', type=str)
     query_text = request.args.get('query_text', type=str)
+    ef_search = request.args.get('ef_search', default=DEFAULT_EF_SEARCH, type=int)
+    probes = request.args.get('probes', default=DEFAULT_PROBES, type=int)
+    radius_km = request.args.get('radius_km', type=float)
 
     if (not fault_id or fault_id.strip() == "") and (not query_text or query_text.strip() == ""):
         return jsonify({"error": "Either fault_id or query_text must be provided"}), 400
+    if not (1 <= ef_search <= MAX_SEARCH_KNOB and 1 <= probes <= MAX_SEARCH_KNOB):
+        return jsonify({"error": f"ef_search and probes must be between 1 and {MAX_SEARCH_KNOB}"}), 400
+    if radius_km is not None and radius_km <= 0:
+        return jsonify({"error": "radius_km must be positive"}), 400
+    radius_m = radius_km * 1000 if radius_km else None
+
+    fault_id = fault_id.strip() if fault_id else ""
+    query_text = query_text.strip() if query_text else ""
+    cache_key = recommendation_key(fault_id, query_text, user_lat, user_lon, ef_search, probes, radius_m)
+    cached = response_cache.get(cache_key)
+    if cached is None:
+        body, status = businesses_payload(
+            find_recommendations(user_lat, user_lon, fault_id, query_text, ef_search, probes, radius_m)
+        )
+        cached = (json.dumps(body), status)
+        response_cache.put(cache_key, cached)
+    return Response(cached[0], status=cached[1], mimetype="application/json")
+
+def find_recommendations(user_lat, user_lon, fault_id, query_text, ef_search, probes, radius_m=None):
+    """
+    Ranked businesses for a fault or a free-text description, optionally near the user.
+    """
+    has_location = user_lat is not None and user_lon is not None
+
+    if snapshot_engine is not None:
+        ranked = snapshot_engine.recommend(
+            recommendation_versions(),
+            RANKING,
+            fault_id=fault_id or None,
+            query_vector=None if fault_id else encode_query(query_text),
+            user_lat=user_lat,
+            user_lon=user_lon,
+            radius_m=radius_m
+        )
+        # None means the snapshot is stale or missing; fall back to SQL
+        if ranked is not None:
+            return ranked
+
+    with db_pool.connection() as conn:
+        if fault_id and use_composite_ranking():
+            # candidates and composite-score ranking in one statement
+            if has_location:
+                return get_nearest_businesses_by_fault(conn, fault_id, user_lat, user_lon, radius_m)
+            return get_top_businesses_by_fault(conn, fault_id)
 
-    conn = get_db_conn()
-    try:
         # gain business_ids
-        if fault_id and fault_id.strip():
-            business_ids = get_business_ids_by_fault(conn, fault_id.strip())
+        if fault_id:
+            business_ids = get_business_ids_by_fault(conn, fault_id)
+        elif SEMANTIC_SEARCH_LEVEL == "business":
+            business_ids = get_business_ids_by_embedding(conn, query_text, ef_search)
         else:
-            business_ids = get_business_ids_by_similarity(conn, query_text.strip())
+            business_ids = get_business_ids_by_similarity(conn, query_text, ef_search, probes)
 
         if not business_ids:
-            return jsonify({
-                "businesses": [],
-                "message": "No matching businesses found. Please try another fault part or description."
-            }), 404
-
-        if user_lat is not None and user_lon is not None:
-            # calculate the nearest store using PostGIS
-            nearest_query = """
-                SELECT name, stars, address, ST_AsGeoJSON(geom) AS geom,
-                       ST_Distance(geom, ST_SetSRID(ST_MakePoint(%s, %s), 4326)::geography) AS distance
-                FROM business
-                WHERE business_id = ANY(%s)
-                ORDER BY distance ASC
-                LIMIT 7;
-            """
-            cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
-            cur.execute(nearest_query, (user_lon, user_lat, business_ids))
-            rows = cur.fetchall()
-            cur.close()
-
-            nearest_businesses = [
-                {
-                    "name": row["name"],
-                    "stars": row["stars"],
-                    "address": row["address"],
-                    "geom": row["geom"],
-                    "distance": row["distance"]
-                }
-                for row in rows
-            ]
-
-            # sort by rating
-            sorted_businesses = sorted(nearest_businesses, key=lambda x: -x["stars"])
+            return []
+
+        if has_location:
+            # nearest shops via the GiST index, ranked in SQL
+            sorted_businesses = get_nearest_businesses(conn, business_ids, user_lat, user_lon, radius_m)
         else:
             business_details = get_business_details_with_location(conn, business_ids)
-            sorted_businesses = sorted(business_details, key=lambda x: -x["stars"])[:7]
-
-        result = {
-            "businesses": [
-                {
-                    "name": b["name"],
-                    "stars": b["stars"],
-                    "address": b["address"],
-                    "geom": b["geom"]
-                }
-                for b in sorted_businesses
-            ]
-        }
+            sorted_businesses = rank_businesses(business_details, RESULT_LIMIT)
 
-        return jsonify(result)
-    finally:
-        conn.close()
+        return sorted_businesses
+
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    """
+    Runtime metrics of the backend.
+    """
+    return jsonify({
+        "db_pool": db_pool.pool_stats(),
+        "query_cache": query_cache.stats(),
+        "fault_catalog": fault_catalog.stats(),
+        "maintenance_tips": seasonal_tips.stats(),
+        "encode_batcher": encode_batcher.stats(),
+        "model": model.stats(),
+        "response_cache": response_cache.stats(),
+        "snapshot_engine": snapshot_engine.stats() if snapshot_engine is not None else None
+    })
 
 if __name__ == "__main__":
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,373 @@
+"""
+Async (ASGI) serving mode for the recommendation API.
+
+Serves the same /api/fault-parts, /api/recommend, /api/maintenance_tips and /api/metrics
+endpoints as app.py, with an asyncpg connection pool for the recommendation queries.
+Model inference runs on a bounded thread pool, and semantic searches have their own
+concurrency limit, so a burst of slow embeddings cannot stall the catalog or fault-based requests.
+
+The queries mirror the ones in app.py (asyncpg needs $n placeholders); ranking, the response
+cache key, the ANN settings, the fault catalog and the seasonal tips are shared modules.
+Only in app.py: the in-memory snapshot engine (USE_SNAPSHOT_ENGINE) and the encode
+micro-batcher, since here concurrent encodes are already bounded by MODEL_THREADS.
+
+Run with:
+    uvicorn asgi_app:app --app-dir code/backend --port 5000 --workers 2
+"""
+
+import asyncio
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+
+import asyncpg
+from dotenv import load_dotenv
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+import db_pool
+from version_watcher import watcher as data_versions
+from fault_catalog import FaultPartsCatalog, FAULT_PARTS_MAX_AGE
+from model_loader import LazyModel
+from query_cache import QueryEmbeddingCache, vector_literal
+from ranking import businesses_payload
+from response_cache import ResponseCache, recommendation_cache_key
+from seasonal_tips_app import current_season, normalize_season, seasonal_tips
+from vector_index import search_settings
+
+load_dotenv()
+
+POOL_MIN = int(os.getenv("DB_POOL_MIN", "1"))
+POOL_MAX = int(os.getenv("DB_POOL_MAX", "10"))
+STATEMENT_TIMEOUT = float(os.getenv("DB_STATEMENT_TIMEOUT_MS", "10000")) / 1000
+# Threads running model.encode; each holds one inference at a time
+MODEL_THREADS = int(os.getenv("MODEL_THREADS", "2"))
+# Semantic searches admitted at once; the rest wait up to SEMANTIC_QUEUE_TIMEOUT seconds, then get a 503
+SEMANTIC_CONCURRENCY = int(os.getenv("SEMANTIC_CONCURRENCY", "8"))
+SEMANTIC_QUEUE_TIMEOUT = float(os.getenv("SEMANTIC_QUEUE_TIMEOUT", "5"))
+# Same ANN knobs and semantic search level as app.py
+DEFAULT_EF_SEARCH = int(os.getenv("VECTOR_EF_SEARCH", "100"))
+DEFAULT_PROBES = int(os.getenv("VECTOR_PROBES", "10"))
+MAX_SEARCH_KNOB = 1000
+SEMANTIC_SEARCH_LEVEL = os.getenv("SEMANTIC_SEARCH_LEVEL", "reviews")
+SIMILAR_REVIEW_LIMIT = 100
+SIMILAR_BUSINESS_LIMIT = int(os.getenv("SIMILAR_BUSINESS_LIMIT", "20"))
+RESULT_LIMIT = 7
+SPATIAL_CANDIDATES = int(os.getenv("SPATIAL_CANDIDATES", "50"))
+DISTANCE_SCALE_M = float(os.getenv("DISTANCE_SCALE_M", "25000"))
+RATING_WEIGHT = float(os.getenv("RATING_WEIGHT", "0.6"))
+DISTANCE_WEIGHT = float(os.getenv("DISTANCE_WEIGHT", "0.4"))
+# Same switch as app.py: rank fault searches by business_fault_scores or by best_business + rating;
+# composite falls back to best_business while the scores table does not exist
+FAULT_RANKING = os.getenv("FAULT_RANKING", "composite")
+
+model = LazyModel()
+model_executor = ThreadPoolExecutor(max_workers=MODEL_THREADS, thread_name_prefix="encode")
+query_cache = QueryEmbeddingCache()
+response_cache = ResponseCache()
+fault_catalog = FaultPartsCatalog()
+semantic_slots = asyncio.Semaphore(SEMANTIC_CONCURRENCY)
+pool = None
+composite_scores_ready = False
+stats = {"semantic_in_flight": 0, "semantic_rejected": 0}
+
+# Recommendations depend on these batch outputs; a bump drops every cached response
+RECOMMENDATION_DATASETS = ("business_stats", "embeddings", "composite_scores")
+data_versions.subscribe(RECOMMENDATION_DATASETS, response_cache.clear)
+data_versions.subscribe(("fault_parts",), fault_catalog.refresh)
+
+
+def recommendation_versions():
+    return tuple(data_versions.get(name) for name in RECOMMENDATION_DATASETS)
+
+
+def check_composite_scores(name=None, version=None):
+    """
+    Record whether business_fault_scores exists; called at startup and when its data version changes.
+    Runs on the watcher thread, so it checks through the psycopg2 pool like app.py.
+    """
+    global composite_scores_ready
+    try:
+        ready = db_pool.table_exists("business_fault_scores")
+    except Exception as e:
+        print(f"composite scores check failed: {e}")
+        return
+    if ready != composite_scores_ready:
+        composite_scores_ready = ready
+        response_cache.clear()
+
+
+data_versions.subscribe(("composite_scores",), check_composite_scores)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    global pool
+    pool = await asyncpg.create_pool(
+        host=os.getenv("DB_HOST"),
+        database=os.getenv("DB_NAME"),
+        user=os.getenv("DB_USER"),
+        password=os.getenv("DB_PASSWORD"),
+        port=int(os.getenv("DB_PORT", "5432")),
+        min_size=POOL_MIN,
+        max_size=POOL_MAX,
+        command_timeout=STATEMENT_TIMEOUT,
+        max_inactive_connection_lifetime=300,
+    )
+    loop = asyncio.get_running_loop()
+    # The in-memory catalogs load through the psycopg2 pool; keep that off the event loop
+    await loop.run_in_executor(None, check_composite_scores)
+    await loop.run_in_executor(None, fault_catalog.refresh)
+    await loop.run_in_executor(None, seasonal_tips.refresh)
+    data_versions.start()
+    if os.getenv("MODEL_WARMUP", "1") == "1":
+        model.warm_up_async()
+    try:
+        yield
+    finally:
+        data_versions.stop()
+        await pool.close()
+        model_executor.shutdown(wait=False)
+
+
+async def encode_query(query_text):
+    loop = asyncio.get_running_loop()
+    vector = await loop.run_in_executor(model_executor, query_cache.get_or_encode, query_text, model.encode)
+    return vector_literal(vector)
+
+
+async def fault_parts(request):
+    """
+    Fault catalog from memory, with the same ETag / If-None-Match handling as app.py.
+    """
+    body, etag = fault_catalog.get()
+    quoted = f'"{etag}"'
+    not_modified = quoted in [t.strip() for t in request.headers.get("if-none-match", "").split(",")]
+    fault_catalog.record(not_modified)
+    headers = {"ETag": quoted, "Cache-Control": f"public, max-age={FAULT_PARTS_MAX_AGE}"}
+    if not_modified:
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
+
+
+async def maintenance_tips(request):
+    season = normalize_season(request.query_params.get("season") or current_season())
+    try:
+        tips = await asyncio.get_running_loop().run_in_executor(None, seasonal_tips.get, season)
+    except Exception as e:
+        return JSONResponse({"error": str(e)}, status_code=500)
+    return JSONResponse(tips)
+
+
+async def business_ids_by_fault(conn, fault_id):
+    rows = await conn.fetch("SELECT business_id FROM business WHERE best_business = $1", fault_id)
+    return [r["business_id"] for r in rows]
+
+
+async def top_businesses_by_fault(conn, fault_id):
+    return await conn.fetch("""
+        SELECT b.name, b.stars, b.address, ST_AsGeoJSON(b.geom) AS geom
+        FROM business_fault_scores s
+        JOIN business b ON b.business_id = s.business_id
+        WHERE s.fault_type = $1
+        ORDER BY s.composite_score DESC
+        LIMIT $2
+    """, fault_id, RESULT_LIMIT)
+
+
+async def nearest_businesses_by_fault(conn, fault_id, user_lat, user_lon, radius_m):
+    return await conn.fetch("""
+        WITH point AS (
+            SELECT ST_SetSRID(ST_MakePoint($1, $2), 4326)::geography AS location
+        ),
+        nearest AS (
+            SELECT b.name, b.stars, b.address, b.geom, s.composite_score, b.geom <-> p.location AS distance
+            FROM business_fault_scores s
+            JOIN business b ON b.business_id = s.business_id
+            CROSS JOIN point p
+            WHERE s.fault_type = $3
+              AND ($4::float8 IS NULL OR ST_DWithin(b.geom, p.location, $4::float8))
+            ORDER BY b.geom <-> p.location
+            LIMIT $5
+        )
+        SELECT name, stars, address, ST_AsGeoJSON(geom) AS geom
+        FROM nearest
+        ORDER BY $6 * COALESCE(composite_score / NULLIF(MAX(composite_score) OVER (), 0), 0)
+                 + $7 * (1 - LEAST(distance / $8, 1)) DESC, distance
+        LIMIT $9
+    """, user_lon, user_lat, fault_id, radius_m, SPATIAL_CANDIDATES,
+        RATING_WEIGHT, DISTANCE_WEIGHT, radius_m or DISTANCE_SCALE_M, RESULT_LIMIT)
+
+
+async def apply_search_settings(conn, ef_search=None, probes=None, limit=None):
+    """
+    Transaction-local ANN knobs, same values as vector_index.apply_search_settings.
+    """
+    for setting, value in search_settings(ef_search, probes, limit):
+        await conn.execute("SELECT set_config($1, $2, true)", setting, value)
+
+
+async def business_ids_by_similarity(conn, vector_literal, ef_search, probes):
+    async with conn.transaction():
+        await apply_search_settings(conn, ef_search, probes, limit=SIMILAR_REVIEW_LIMIT)
+        rows = await conn.fetch("""
+            SELECT business_id
+            FROM reviews
+            ORDER BY embedding <=> $1::text::vector
+            LIMIT $2
+        """, vector_literal, SIMILAR_REVIEW_LIMIT)
+    return list({r["business_id"] for r in rows})
+
+
+async def business_ids_by_embedding(conn, vector_literal, ef_search):
+    async with conn.transaction():
+        await apply_search_settings(conn, ef_search=ef_search, limit=SIMILAR_BUSINESS_LIMIT)
+        rows = await conn.fetch("""
+            SELECT business_id
+            FROM business_embeddings
+            ORDER BY embedding <=> $1::text::vector
+            LIMIT $2
+        """, vector_literal, SIMILAR_BUSINESS_LIMIT)
+    return [r["business_id"] for r in rows]
+
+
+async def nearest_businesses(conn, business_ids, user_lat, user_lon, radius_m):
+    return await conn.fetch("""
+        WITH point AS (
+            SELECT ST_SetSRID(ST_MakePoint($1, $2), 4326)::geography AS location
+        ),
+        nearest AS (
+            SELECT b.name, b.stars, b.address, b.geom, b.geom <-> p.location AS distance
+            FROM business b, point p
+            WHERE b.business_id = ANY($3::text[])
+              AND ($4::float8 IS NULL OR ST_DWithin(b.geom, p.location, $4::float8))
+            ORDER BY b.geom <-> p.location
+            LIMIT $5
+        )
+        SELECT name, stars, address, ST_AsGeoJSON(geom) AS geom
+        FROM nearest
+        ORDER BY $6 * COALESCE(stars, 0) / 5.0 + $7 * (1 - LEAST(distance / $8, 1)) DESC, distance
+        LIMIT $9
+    """, user_lon, user_lat, business_ids, radius_m, SPATIAL_CANDIDATES,
+        RATING_WEIGHT, DISTANCE_WEIGHT, radius_m or DISTANCE_SCALE_M, RESULT_LIMIT)
+
+
+async def best_rated_businesses(conn, business_ids):
+    return await conn.fetch("""
+        SELECT name, stars, address, ST_AsGeoJSON(geom) AS geom
+        FROM business
+        WHERE business_id = ANY($1::text[])
+        ORDER BY stars DESC NULLS LAST
+        LIMIT $2
+    """, business_ids, RESULT_LIMIT)
+
+
+def query_param(params, name, type, default=None):
+    """
+    Like Flask's request.args.get(name, default, type): a missing or malformed value gives the default.
+    """
+    try:
+        return type(params[name]) if params.get(name) else default
+    except ValueError:
+        return default
+
+
+async def recommend(request):
+    params = request.query_params
+    # Each parameter is parsed on its own, so one bad value does not drop the others
+    user_lat = query_param(params, "user_lat", float)
+    user_lon = query_param(params, "user_lon", float)
+    radius_km = query_param(params, "radius_km", float)
+    ef_search = query_param(params, "ef_search", int, DEFAULT_EF_SEARCH)
+    probes = query_param(params, "probes", int, DEFAULT_PROBES)
+    fault_id = (params.get("fault_id") or "").strip()
+    query_text = (params.get("query_text") or "").strip()
+
+    if not fault_id and not query_text:
+        return JSONResponse({"error": "Either fault_id or query_text must be provided"}, status_code=400)
+    if not (1 <= ef_search <= MAX_SEARCH_KNOB and 1 <= probes <= MAX_SEARCH_KNOB):
+        return JSONResponse({"error": f"ef_search and probes must be between 1 and {MAX_SEARCH_KNOB}"},
+                            status_code=400)
+    if radius_km is not None and radius_km <= 0:
+        return JSONResponse({"error": "radius_km must be positive"}, status_code=400)
+    radius_m = radius_km * 1000 if radius_km else None
+
+    cache_key = recommendation_cache_key(fault_id, query_text, user_lat, user_lon, ef_search, probes, radius_m,
+                                         recommendation_versions())
+    cached = response_cache.get(cache_key)
+    if cached is None:
+        if fault_id:
+            businesses = await find_by_fault(fault_id, user_lat, user_lon, radius_m)
+        else:
+            try:
+                await asyncio.wait_for(semantic_slots.acquire(), SEMANTIC_QUEUE_TIMEOUT)
+            except asyncio.TimeoutError:
+                stats["semantic_rejected"] += 1
+                return JSONResponse({"error": "Too many concurrent searches, please retry"}, status_code=503)
+            stats["semantic_in_flight"] += 1
+            try:
+                businesses = await find_by_query(query_text, user_lat, user_lon, ef_search, probes, radius_m)
+            finally:
+                stats["semantic_in_flight"] -= 1
+                semantic_slots.release()
+        body, status = businesses_payload(businesses)
+        cached = (json.dumps(body), status)
+        response_cache.put(cache_key, cached)
+    return Response(cached[0], status_code=cached[1], media_type="application/json")
+
+
+async def find_by_fault(fault_id, user_lat, user_lon, radius_m):
+    async with pool.acquire() as conn:
+        if FAULT_RANKING == "composite" and composite_scores_ready:
+            if user_lat is not None and user_lon is not None:
+                return await nearest_businesses_by_fault(conn, fault_id, user_lat, user_lon, radius_m)
+            return await top_businesses_by_fault(conn, fault_id)
+        business_ids = await business_ids_by_fault(conn, fault_id)
+        return await rank_business_ids(conn, business_ids, user_lat, user_lon, radius_m)
+
+
+async def find_by_query(query_text, user_lat, user_lon, ef_search, probes, radius_m):
+    vector_literal = await encode_query(query_text)
+    async with pool.acquire() as conn:
+        if SEMANTIC_SEARCH_LEVEL == "business":
+            business_ids = await business_ids_by_embedding(conn, vector_literal, ef_search)
+        else:
+            business_ids = await business_ids_by_similarity(conn, vector_literal, ef_search, probes)
+        return await rank_business_ids(conn, business_ids, user_lat, user_lon, radius_m)
+
+
+async def rank_business_ids(conn, business_ids, user_lat, user_lon, radius_m):
+    if not business_ids:
+        return []
+    if user_lat is not None and user_lon is not None:
+        return await nearest_businesses(conn, business_ids, user_lat, user_lon, radius_m)
+    return await best_rated_businesses(conn, business_ids)
+
+
+async def metrics(request):
+    return JSONResponse({
+        "db_pool": {
+            "size": pool.get_size(),
+            "idle": pool.get_idle_size(),
+            "max_size": POOL_MAX,
+        },
+        "semantic": dict(stats, limit=SEMANTIC_CONCURRENCY),
+        "query_cache": query_cache.stats(),
+        "fault_catalog": fault_catalog.stats(),
+        "maintenance_tips": seasonal_tips.stats(),
+        "model": model.stats(),
+        "response_cache": response_cache.stats(),
+    })
+
+
+app = Starlette(
+    routes=[
+        Route("/api/fault-parts", fault_parts),
+        Route("/api/recommend", recommend),
+        Route("/api/maintenance_tips", maintenance_tips),
+        Route("/api/metrics", metrics),
+    ],
+    lifespan=lifespan,
+)
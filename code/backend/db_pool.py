@@ -0,0 +1,164 @@
+"""
+Shared pooled PostgreSQL connections for the Flask backends.
+
+Connections are reused across requests, checked before being handed out, and carry
+their own set of prepared statements so the fixed queries are planned once per connection.
+"""
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+import psycopg2.extensions
+import psycopg2.pool
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DB_CONFIG = {
+    "host": os.getenv("DB_HOST"),
+    "dbname": os.getenv("DB_NAME"),
+    "user": os.getenv("DB_USER"),
+    "password": os.getenv("DB_PASSWORD"),
+    "port": os.getenv("DB_PORT", "5432"),
+    "connect_timeout": int(os.getenv("DB_CONNECT_TIMEOUT", "5")),
+    "options": f"-c statement_timeout={os.getenv('DB_STATEMENT_TIMEOUT_MS', '10000')}",
+}
+POOL_MIN = int(os.getenv("DB_POOL_MIN", "1"))
+POOL_MAX = int(os.getenv("DB_POOL_MAX", "10"))
+# Seconds a request waits for a free connection before giving up
+POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "5"))
+# Connections idle for longer than this are pinged before reuse
+HEALTH_CHECK_INTERVAL = float(os.getenv("DB_HEALTH_CHECK_INTERVAL", "30"))
+
+
+class PooledConnection(psycopg2.extensions.connection):
+    """
+    psycopg2 connection that remembers which statements were prepared on it.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared = set()
+        self.last_used = time.monotonic()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+# ThreadedConnectionPool raises when exhausted; the semaphore makes callers wait up to POOL_TIMEOUT instead
+_slots = threading.BoundedSemaphore(POOL_MAX)
+_stats = {"in_use": 0, "acquired": 0, "waits": 0, "timeouts": 0, "reconnects": 0}
+_stats_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = psycopg2.pool.ThreadedConnectionPool(
+                    POOL_MIN, POOL_MAX, connection_factory=PooledConnection, **DB_CONFIG
+                )
+    return _pool
+
+
+def _bump(key, amount=1):
+    with _stats_lock:
+        _stats[key] += amount
+
+
+def _is_healthy(conn):
+    if conn.closed:
+        return False
+    if time.monotonic() - conn.last_used < HEALTH_CHECK_INTERVAL:
+        return True
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1")
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+
+def _checkout():
+    pool = get_pool()
+    conn = pool.getconn()
+    while not _is_healthy(conn):
+        pool.putconn(conn, close=True)
+        _bump("reconnects")
+        conn = pool.getconn()
+    return conn
+
+
+@contextmanager
+def connection():
+    """
+    Borrow a connection for the duration of a with-block.
+    The transaction is committed on success and rolled back on error before the connection goes back to the pool.
+    """
+    if not _slots.acquire(blocking=False):
+        _bump("waits")
+        if not _slots.acquire(timeout=POOL_TIMEOUT):
+            _bump("timeouts")
+            raise psycopg2.pool.PoolError(f"no database connection available within {POOL_TIMEOUT}s")
+    conn = None
+    try:
+        conn = _checkout()
+        _bump("in_use")
+        _bump("acquired")
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            if not conn.closed:
+                conn.rollback()
+            raise
+    finally:
+        if conn is not None:
+            _bump("in_use", -1)
+            conn.last_used = time.monotonic()
+            get_pool().putconn(conn, close=bool(conn.closed))
+        _slots.release()
+
+
+def table_exists(name):
+    """
+    Whether a table is visible to the pooled connections (to_regclass is NULL otherwise).
+    """
+    with connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT to_regclass(%s) IS NOT NULL", (name,))
+            return cur.fetchone()[0]
+
+
+def execute_prepared(cur, name, query, params=()):
+    """
+    Run a fixed query as a server-side prepared statement.
+    query uses $1, $2, ... placeholders; the statement is prepared once per connection.
+    """
+    conn = cur.connection
+    if name not in conn.prepared:
+        cur.execute(f"PREPARE {name} AS {query}")
+        conn.prepared.add(name)
+    if params:
+        cur.execute(f"EXECUTE {name} ({', '.join(['%s'] * len(params))})", params)
+    else:
+        cur.execute(f"EXECUTE {name}")
+
+
+def pool_stats():
+    """
+    Pool occupancy metrics.
+    """
+    with _stats_lock:
+        stats = dict(_stats)
+    stats["max_size"] = POOL_MAX
+    if _pool is not None:
+        stats["open"] = len(_pool._used) + len(_pool._pool)
+        stats["idle"] = len(_pool._pool)
+    else:
+        stats["open"] = stats["idle"] = 0
+    return stats
@@ -0,0 +1,90 @@
+"""
+Micro-batching scheduler for query encoding.
+
+Request threads submit single query strings; one scheduler thread waits up to
+ENCODE_BATCH_WINDOW_MS after the first pending query (or until ENCODE_BATCH_MAX queries
+are waiting), encodes them with one model.encode call and hands each result back.
+"""
+
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+ENCODE_BATCH_WINDOW_MS = float(os.getenv("ENCODE_BATCH_WINDOW_MS", "2"))
+ENCODE_BATCH_MAX = int(os.getenv("ENCODE_BATCH_MAX", "32"))
+ENCODE_TIMEOUT = float(os.getenv("ENCODE_TIMEOUT", "30"))
+# Upper bounds of the batch-size histogram buckets
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+
+
+class EncodeBatcher:
+    def __init__(self, encode_batch, window_ms=ENCODE_BATCH_WINDOW_MS, max_batch=ENCODE_BATCH_MAX):
+        """
+        encode_batch takes a list of strings and returns one vector per string.
+        """
+        self.encode_batch = encode_batch
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._histogram = {bucket: 0 for bucket in BATCH_SIZE_BUCKETS}
+        self._stats = {"batches": 0, "queries": 0, "max_queue_depth": 0, "errors": 0}
+        self._thread = threading.Thread(target=self._run, name="encode-batcher", daemon=True)
+        self._thread.start()
+
+    def encode(self, text):
+        """
+        Encode one query; blocks the calling thread until its batch has been processed.
+        """
+        future = Future()
+        self._queue.put((text, future))
+        depth = self._queue.qsize()
+        with self._lock:
+            self._stats["max_queue_depth"] = max(self._stats["max_queue_depth"], depth)
+        return future.result(timeout=ENCODE_TIMEOUT)
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            texts = [text for text, _ in batch]
+            try:
+                vectors = self.encode_batch(texts)
+            except Exception as e:
+                with self._lock:
+                    self._stats["errors"] += 1
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), vector in zip(batch, vectors):
+                future.set_result(vector)
+            self._record(len(batch))
+
+    def _record(self, size):
+        bucket = next((b for b in BATCH_SIZE_BUCKETS if size <= b), BATCH_SIZE_BUCKETS[-1])
+        with self._lock:
+            self._histogram[bucket] += 1
+            self._stats["batches"] += 1
+            self._stats["queries"] += size
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["batch_size_histogram"] = {f"<={bucket}": count for bucket, count in self._histogram.items()}
+        stats["queue_depth"] = self._queue.qsize()
+        stats["mean_batch_size"] = stats["queries"] / stats["batches"] if stats["batches"] else 0.0
+        stats["window_ms"] = self.window * 1000
+        stats["max_batch"] = self.max_batch
+        return stats
@@ -0,0 +1,75 @@
+"""
+In-memory copy of the fault_parts catalog served by /api/fault-parts.
+
+The list only changes when fault_parts.py regenerates it, which bumps the "fault_parts"
+data version. The serialized body and its ETag are rebuilt then, so requests never
+touch the database and clients can revalidate with If-None-Match.
+"""
+
+import hashlib
+import json
+import os
+import threading
+
+import db_pool
+
+# Browser/proxy cache lifetime for the catalog; clients revalidate with the ETag afterwards
+FAULT_PARTS_MAX_AGE = int(os.getenv("FAULT_PARTS_MAX_AGE", "300"))
+
+
+class FaultPartsCatalog:
+    def __init__(self):
+        self._entry = None
+        self._lock = threading.Lock()
+        # Separate from _lock, which is held while the first load runs
+        self._stats_lock = threading.Lock()
+        self._stats = {"loads": 0, "served": 0, "not_modified": 0}
+
+    def _count(self, key):
+        with self._stats_lock:
+            self._stats[key] += 1
+
+    def load(self):
+        with db_pool.connection() as conn:
+            cur = conn.cursor()
+            db_pool.execute_prepared(cur, "fault_parts_list", "SELECT part_name FROM fault_parts ORDER BY part_name")
+            parts = [r[0] for r in cur.fetchall()]
+            cur.close()
+        body = json.dumps({"fault_parts": parts})
+        etag = hashlib.sha1(body.encode("utf-8")).hexdigest()
+        # Body and ETag are swapped together so they always match
+        self._entry = (body, etag, len(parts))
+        self._count("loads")
+
+    def refresh(self, name=None, version=None):
+        """
+        Reload the catalog; signature matches DataVersionWatcher callbacks.
+        """
+        try:
+            self.load()
+        except Exception as e:
+            print(f"fault parts reload failed: {e}")
+
+    def get(self):
+        """
+        (body, etag) of the current catalog, loading it on first use.
+        """
+        if self._entry is None:
+            with self._lock:
+                if self._entry is None:
+                    self.load()
+        body, etag, _ = self._entry
+        return body, etag
+
+    def record(self, not_modified):
+        self._count("not_modified" if not_modified else "served")
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        entry = self._entry
+        stats["loaded"] = entry is not None
+        if entry is not None:
+            stats["parts"] = entry[2]
+            stats["etag"] = entry[1]
+        return stats
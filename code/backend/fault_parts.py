@@ -1,7 +1,11 @@
 import os
+import sys
 import psycopg2
 import psycopg2.extras
 from dotenv import load_dotenv
+# bump_data_version lives with the other batch helpers in code/scripts
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts"))
+from data_version import bump_data_version
 
 load_dotenv()  
 
@@ -57,6 +61,7 @@ def main():
         except Exception as e:
             print(f"Error inserting part {part}: {e}")
 
+    bump_data_version(cur, "fault_parts")
     conn.commit()
     cur.close()
     conn.close()
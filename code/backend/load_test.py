@@ -0,0 +1,84 @@
+"""
+Closed-loop load test for the recommendation API.
+
+Each simulated client sends requests back to back for the given duration, mixing
+catalog, maintenance tips, fault-based and semantic searches. Prints throughput and latency
+percentiles per concurrency level, e.g.:
+
+    python code/backend/load_test.py --url http://127.0.0.1:5000 --concurrency 50 200 --duration 30
+
+app.py and asgi_app.py serve the same endpoints with the same response cache, so the two
+modes (SERVER_MODE in start.sh) can be compared on one request mix. Start both with the same
+USE_SNAPSHOT_ENGINE=0, since the snapshot engine only exists in app.py.
+"""
+
+import argparse
+import asyncio
+import random
+import time
+
+import httpx
+
+QUERIES = ["brakes squeaking", "check engine light", "battery keeps dying", "ac blows warm air", "flat tire"]
+LOCATIONS = [(39.9526, -75.1652), (40.4406, -79.9959), (40.0379, -76.3055)]
+
+
+def pick_request(fault_parts):
+    roll = random.random()
+    if roll < 0.15 or not fault_parts:
+        return "/api/fault-parts", {}
+    if roll < 0.2:
+        return "/api/maintenance_tips", {}
+    params = {}
+    if roll < 0.6:
+        params["fault_id"] = random.choice(fault_parts)
+    else:
+        params["query_text"] = random.choice(QUERIES)
+    if random.random() < 0.5:
+        params["user_lat"], params["user_lon"] = random.choice(LOCATIONS)
+    return "/api/recommend", params
+
+
+async def client_loop(client, deadline, fault_parts, latencies, errors):
+    while time.perf_counter() < deadline:
+        path, params = pick_request(fault_parts)
+        start = time.perf_counter()
+        try:
+            response = await client.get(path, params=params)
+            # 404 is a valid "no matching shops" answer
+            if response.status_code not in (200, 404):
+                errors.append(response.status_code)
+        except httpx.HTTPError as e:
+            errors.append(type(e).__name__)
+        latencies.append(time.perf_counter() - start)
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(int(len(values) * p), len(values) - 1)] * 1000 if values else 0.0
+
+
+async def run(url, concurrency, duration):
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, timeout=30, limits=limits) as client:
+        fault_parts = (await client.get("/api/fault-parts")).json().get("fault_parts", [])
+        latencies, errors = [], []
+        deadline = time.perf_counter() + duration
+        start = time.perf_counter()
+        await asyncio.gather(*[
+            client_loop(client, deadline, fault_parts, latencies, errors) for _ in range(concurrency)
+        ])
+        elapsed = time.perf_counter() - start
+    print(f"{concurrency:>6} clients: {len(latencies) / elapsed:8.1f} req/s  "
+          f"p50 {percentile(latencies, 0.5):7.1f} ms  p95 {percentile(latencies, 0.95):7.1f} ms  "
+          f"p99 {percentile(latencies, 0.99):7.1f} ms  errors {len(errors)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test the recommendation API.")
+    parser.add_argument("--url", default="http://127.0.0.1:5000")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[50, 200])
+    parser.add_argument("--duration", type=float, default=30)
+    args = parser.parse_args()
+    for level in args.concurrency:
+        asyncio.run(run(args.url, level, args.duration))
@@ -0,0 +1,147 @@
+"""
+Lazy loading of the query embedding model, with optional ONNX Runtime backends.
+
+MODEL_BACKEND selects the inference backend:
+    torch      full-precision PyTorch weights (default)
+    onnx       ONNX Runtime, fp32
+    onnx-int8  ONNX Runtime with the int8 dynamically quantized export
+
+The ONNX backends need the extra packages in requirements-onnx.txt.
+
+Review embeddings in the database are produced with torch; run this module to check that
+another backend gives the same vectors and to compare cold-start time and memory:
+
+    python code/backend/model_loader.py --backends torch onnx onnx-int8
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import threading
+import time
+
+MODEL_NAME = "all-MiniLM-L6-v2"
+MODEL_BACKEND = os.getenv("MODEL_BACKEND", "torch")
+ONNX_INT8_FILE = os.getenv("ONNX_INT8_FILE", "onnx/model_qint8_avx512_vnni.onnx")
+# Minimum cosine similarity to the torch embedding for a backend to pass the parity check
+PARITY_THRESHOLD = 0.99
+
+PARITY_SENTENCES = [
+    "brakes squeaking when I stop",
+    "check engine light came on",
+    "they replaced my alternator and battery quickly",
+    "great service on my transmission, fair price",
+    "AC blows warm air in the summer",
+]
+
+
+def load_model(backend=MODEL_BACKEND):
+    from sentence_transformers import SentenceTransformer
+
+    if backend == "torch":
+        return SentenceTransformer(MODEL_NAME)
+    if backend == "onnx":
+        return SentenceTransformer(MODEL_NAME, backend="onnx")
+    if backend == "onnx-int8":
+        return SentenceTransformer(MODEL_NAME, backend="onnx", model_kwargs={"file_name": ONNX_INT8_FILE})
+    raise ValueError(f"unknown model backend: {backend}")
+
+
+class LazyModel:
+    """
+    Stand-in for a SentenceTransformer that loads it on first use.
+    """
+
+    def __init__(self, backend=MODEL_BACKEND):
+        self.backend = backend
+        self._model = None
+        self._lock = threading.Lock()
+        self.load_seconds = None
+
+    def get(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    start = time.perf_counter()
+                    model = load_model(self.backend)
+                    self.load_seconds = time.perf_counter() - start
+                    self._model = model
+        return self._model
+
+    def encode(self, *args, **kwargs):
+        return self.get().encode(*args, **kwargs)
+
+    def warm_up_async(self):
+        """
+        Load the model and run one encode in a background thread, so the first semantic
+        query does not pay for it while the app is already serving other endpoints.
+        """
+        def warm_up():
+            try:
+                self.encode(["warm up"])
+            except Exception as e:
+                print(f"model warm-up failed: {e}")
+
+        threading.Thread(target=warm_up, name="model-warm-up", daemon=True).start()
+
+    def stats(self):
+        return {"backend": self.backend, "loaded": self._model is not None, "load_seconds": self.load_seconds}
+
+
+def measure(backend):
+    """
+    Load one backend and report load time, first-encode time, peak RSS and the parity embeddings.
+    Runs in a fresh interpreter (see benchmark) so memory numbers are not shared between backends.
+    """
+    start = time.perf_counter()
+    model = load_model(backend)
+    load_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    vectors = model.encode(PARITY_SENTENCES, normalize_embeddings=True)
+    encode_seconds = time.perf_counter() - start
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak_rss_mb = peak_rss / (1024 * 1024) if sys.platform == "darwin" else peak_rss / 1024
+    return {
+        "backend": backend,
+        "load_seconds": load_seconds,
+        "encode_seconds": encode_seconds,
+        "peak_rss_mb": peak_rss_mb,
+        "vectors": vectors.tolist(),
+    }
+
+
+def benchmark(backends):
+    results = {}
+    for backend in backends:
+        output = subprocess.run(
+            [sys.executable, __file__, "--measure", backend],
+            check=True, capture_output=True, text=True
+        ).stdout
+        results[backend] = json.loads(output.strip().splitlines()[-1])
+
+    import numpy as np
+
+    reference = np.array(results[backends[0]]["vectors"])
+    print(f"{'backend':>10} {'load s':>8} {'encode s':>9} {'peak RSS MB':>12} {'min cos':>8} {'parity':>7}")
+    for backend in backends:
+        result = results[backend]
+        similarity = np.sum(reference * np.array(result["vectors"]), axis=1)
+        passed = similarity.min() >= PARITY_THRESHOLD
+        print(f"{backend:>10} {result['load_seconds']:>8.2f} {result['encode_seconds']:>9.3f} "
+              f"{result['peak_rss_mb']:>12.0f} {similarity.min():>8.4f} {'ok' if passed else 'FAIL':>7}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare embedding model backends.")
+    parser.add_argument("--backends", nargs="+", default=["torch", "onnx", "onnx-int8"],
+                        help="the first backend is the parity reference")
+    parser.add_argument("--measure", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.measure:
+        print(json.dumps(measure(args.measure)))
+    else:
+        benchmark(args.backends)
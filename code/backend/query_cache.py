@@ -0,0 +1,106 @@
+"""
+Cache of query text -> embedding for the semantic search endpoint.
+
+Queries are normalized (case and whitespace) before lookup. Entries live in an in-process
+LRU with a TTL; when QUERY_CACHE_PATH is set they are also kept in a SQLite file so every
+worker on the host shares the vectors encoded by the others.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "1024"))
+QUERY_CACHE_TTL = float(os.getenv("QUERY_CACHE_TTL", "86400"))
+QUERY_CACHE_PATH = os.getenv("QUERY_CACHE_PATH")
+
+
+def normalize_query(query_text):
+    return " ".join(query_text.lower().split())
+
+
+def vector_literal(vector):
+    """
+    pgvector text literal of a vector, with each component in its shortest float32 form
+    (0.1, not the float64 widening 0.10000000149011612). Pass it as a parameter cast to ::vector.
+    """
+    return "[" + ",".join(
+        np.format_float_positional(x, unique=True, trim="-") for x in np.asarray(vector, dtype=np.float32)
+    ) + "]"
+
+
+class QueryEmbeddingCache:
+    def __init__(self, max_size=QUERY_CACHE_SIZE, ttl=QUERY_CACHE_TTL, path=QUERY_CACHE_PATH):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "disk_hits": 0, "misses": 0}
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS query_embeddings (query TEXT PRIMARY KEY, vector BLOB, created REAL)"
+            )
+
+    def _load(self, key, now):
+        row = self._db.execute(
+            "SELECT vector, created FROM query_embeddings WHERE query = ?", (key,)
+        ).fetchone()
+        if row is None or now - row[1] > self.ttl:
+            return None
+        return np.frombuffer(row[0], dtype=np.float32), row[1]
+
+    def _store(self, key, vector, created):
+        self._db.execute(
+            "INSERT OR REPLACE INTO query_embeddings (query, vector, created) VALUES (?, ?, ?)",
+            (key, vector.tobytes(), created)
+        )
+
+    def get_or_encode(self, query_text, encode):
+        """
+        Return the float32 embedding of query_text, calling encode(normalized_text) only on a miss.
+        """
+        key = normalize_query(query_text)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry[1] <= self.ttl:
+                self._entries.move_to_end(key)
+                self._stats["hits"] += 1
+                return entry[0]
+            if self._db is not None:
+                entry = self._load(key, now)
+                if entry is not None:
+                    self._stats["disk_hits"] += 1
+                    self._remember(key, entry)
+                    return entry[0]
+            self._stats["misses"] += 1
+
+        # Encode outside the lock so other queries are not blocked by the model
+        vector = np.asarray(encode(key), dtype=np.float32)
+        vector.setflags(write=False)
+        with self._lock:
+            self._remember(key, (vector, now))
+            if self._db is not None:
+                self._store(key, vector, now)
+        return vector
+
+    def _remember(self, key, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["size"] = len(self._entries)
+        lookups = stats["hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["hits"] + stats["disk_hits"]) / lookups if lookups else 0.0
+        return stats
@@ -0,0 +1,36 @@
+"""
+Ranking and response shaping shared by the Flask (app.py) and ASGI (asgi_app.py) backends.
+Rows may be dicts or asyncpg records; only item access is used.
+"""
+
+NO_MATCH_MESSAGE = "No matching businesses found. Please try another fault part or description."
+
+
+def rank_businesses(businesses, limit):
+    """
+    Best rated shops first, for searches without a location.
+    Searches with a location are ranked in SQL by rating and closeness.
+    """
+    return sorted(businesses, key=lambda x: -x["stars"])[:limit]
+
+
+def businesses_payload(businesses):
+    """
+    Response body and status code for a ranked list of businesses.
+    """
+    if not businesses:
+        return {
+            "businesses": [],
+            "message": NO_MATCH_MESSAGE
+        }, 404
+    return {
+        "businesses": [
+            {
+                "name": b["name"],
+                "stars": b["stars"],
+                "address": b["address"],
+                "geom": b["geom"]
+            }
+            for b in businesses
+        ]
+    }, 200
@@ -0,0 +1,95 @@
+"""
+Size-bounded cache of serialized /api/recommend responses.
+
+Requests are keyed on the fault or normalized query text and on the geohash cell of the
+user location, so nearby users share an entry. The cache is cleared whenever the data
+versions it depends on change.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+
+from query_cache import normalize_query
+
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "4096"))
+# Precision 6 is a cell of about 1.2 km x 0.6 km
+GEOHASH_PRECISION = int(os.getenv("RESPONSE_CACHE_GEOHASH_PRECISION", "6"))
+
+GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+def geohash(lat, lon, precision=GEOHASH_PRECISION):
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True
+    while len(chars) < precision:
+        value, bounds = (lon, lon_range) if even else (lat, lat_range)
+        mid = (bounds[0] + bounds[1]) / 2
+        bits <<= 1
+        if value >= mid:
+            bits |= 1
+            bounds[0] = mid
+        else:
+            bounds[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(GEOHASH_ALPHABET[bits])
+            bits = 0
+            bit_count = 0
+    return "".join(chars)
+
+
+def recommendation_cache_key(fault_id, query_text, user_lat, user_lon, ef_search, probes, radius_m, versions):
+    """
+    Cache key of a /api/recommend request; versions are the data versions the answer depends on.
+    """
+    if fault_id:
+        target = ("fault", fault_id)
+    else:
+        target = ("query", normalize_query(query_text), ef_search, probes)
+    cell = geohash(user_lat, user_lon) if user_lat is not None and user_lon is not None else None
+    return target + (cell, radius_m, versions)
+
+
+class ResponseCache:
+    def __init__(self, max_size=RESPONSE_CACHE_SIZE):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "invalidations": 0}
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+            return entry
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self, *args):
+        # Accepts the (name, version) arguments of a data version callback
+        with self._lock:
+            self._entries.clear()
+            self._stats["invalidations"] += 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["size"] = len(self._entries)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
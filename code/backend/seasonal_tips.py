@@ -1,42 +1,77 @@
+import argparse
+import csv
 import os
-import pandas as pd
+import sys
+import db_pool
+# bump_data_version lives with the other batch helpers in code/scripts
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts"))
+from data_version import bump_data_version
 
-# Dynamically get the Desktop path
-desktop_path = os.path.join(os.path.expanduser("~"), "Desktop")
-file_path = os.path.join(desktop_path, "seasonal_fault_trends.csv")
+# For each fault type, the failure probability of a season is its repair count in that quarter
+# divided by the fault's average over the four quarters (missing quarters count as 0).
+# The top 3 fault types per season are stored in maintenance_tips.
+regenerate_tips_query = """
+CREATE TABLE IF NOT EXISTS maintenance_tips (
+    season TEXT NOT NULL,
+    part_name TEXT NOT NULL,
+    failure_probability DOUBLE PRECISION
+);
+DELETE FROM maintenance_tips;
+WITH totals AS (
+    SELECT fault_type, quarter, SUM(n) AS n
+    FROM fault_quarter_counts
+    GROUP BY fault_type, quarter
+),
+grid AS (
+    SELECT f.fault_type, q.quarter, COALESCE(t.n, 0) AS n
+    FROM (SELECT DISTINCT fault_type FROM totals) f
+    CROSS JOIN generate_series(1, 4) AS q(quarter)
+    LEFT JOIN totals t ON t.fault_type = f.fault_type AND t.quarter = q.quarter
+),
+probabilities AS (
+    SELECT fault_type, quarter,
+           n::float8 / NULLIF(AVG(n) OVER (PARTITION BY fault_type), 0) AS failure_probability
+    FROM grid
+),
+ranked AS (
+    SELECT fault_type, quarter, failure_probability,
+           row_number() OVER (
+               PARTITION BY quarter ORDER BY failure_probability DESC NULLS LAST, fault_type COLLATE "C"
+           ) AS rank
+    FROM probabilities
+)
+INSERT INTO maintenance_tips (season, part_name, failure_probability)
+SELECT 'Season_' || quarter, fault_type, failure_probability
+FROM ranked
+WHERE rank <= 3;
+"""
 
-# Check if the file exists
-if not os.path.exists(file_path):
-    raise FileNotFoundError(f"File not found: {file_path}")
+def regenerate_maintenance_tips():
+    """
+    Rebuild maintenance_tips from the fault_quarter_counts rollup and bump its data version,
+    so the tips service reloads it. Returns (season, part_name, failure_probability) rows.
+    """
+    with db_pool.connection() as conn:
+        cur = conn.cursor()
+        cur.execute(regenerate_tips_query)
+        bump_data_version(cur, "maintenance_tips")
+        cur.execute("SELECT season, part_name, failure_probability FROM maintenance_tips ORDER BY season, failure_probability DESC")
+        rows = cur.fetchall()
+        cur.close()
+    return rows
 
-# Load the CSV file and rename columns
-df = pd.read_csv(file_path, header=1)
-df.columns = ['fault_type', '1', '2', '3', '4']
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Regenerate the seasonal maintenance tips.")
+    parser.add_argument("--output", help="optional CSV export of the tips")
+    args = parser.parse_args()
 
-# Ensure numeric types for seasonal columns
-for season in ['1', '2', '3', '4']:
-    df[season] = df[season].astype(float)
+    tips = regenerate_maintenance_tips()
+    for season, part_name, probability in tips:
+        print(f"{season}: {part_name} ({probability:.2f})")
 
-# Calculate annual average for each fault type
-df["annual_average"] = df[['1', '2', '3', '4']].mean(axis=1)
-
-# Calculate seasonal deviation from annual average
-for season in ['1', '2', '3', '4']:
-    df[f"probability_{season}"] = df[season] / df["annual_average"]
-
-# Create a new DataFrame to store top 3 faults per season
-top3_parts = pd.DataFrame()
-
-# Extract top 3 faults per season
-for season in ['1', '2', '3', '4']:
-    top_parts = df.nlargest(3, f"probability_{season}")[["fault_type", f"probability_{season}"]]
-    top_parts["season"] = f"Season_{season}"
-    top_parts.rename(columns={f"probability_{season}": "failure_probability"}, inplace=True)
-    top3_parts = pd.concat([top3_parts, top_parts], ignore_index=True)
-
-# Save the results to a CSV file on the Desktop
-output_path = os.path.join(desktop_path, "seasonal_tips_top3.csv")
-top3_parts.to_csv(output_path, index=False)
-
-# Print confirmation message
-print(f"Results saved to {output_path}")
+    if args.output:
+        with open(args.output, "w", newline="") as file:
+            writer = csv.writer(file)
+            writer.writerow(["season", "part_name", "failure_probability"])
+            writer.writerows(tips)
+        print(f"Results saved to {args.output}")
@@ -1,45 +1,112 @@
-from flask import Flask, jsonify, request
-import psycopg2
-
-app = Flask(__name__)
-
-# Database configuration
-DB_CONFIG = {
-    'dbname': 'yelp',
-    'user': 'postgres',
-    'password': 'econ_finalproject',
-    'host': '34.57.181.108',
-    'port': '5432'
-}
-
-def get_db_connection():
-    """Establish a database connection."""
-    conn = psycopg2.connect(**DB_CONFIG)
-    return conn
-
-@app.route('/api/maintenance_tips', methods=['GET'])
-def get_maintenance_tips():
-    """Get maintenance tips for a specific season."""
-    season = request.args.get('season')  # Retrieve the 'season' parameter from the request
-    if not season:
-        return jsonify({'error': 'Season parameter is required'}), 400
+"""
+Seasonal maintenance tips API.
+
+maintenance_tips holds only the top 3 parts of each season, so the whole table is kept in
+memory and reloaded when seasonal_tips.py bumps the "maintenance_tips" data version.
+The route lives on a blueprint that app.py mounts; this module can still run on its own.
+"""
+
+import datetime
+import threading
+
+from flask import Blueprint, Flask, jsonify, request
+
+import db_pool
+from version_watcher import watcher as data_versions
+
+tips_bp = Blueprint('maintenance_tips', __name__)
+
+
+def current_season(today=None):
+    """Season label of the current calendar quarter, e.g. 'Season_2' in May."""
+    today = today or datetime.date.today()
+    return f"Season_{(today.month - 1) // 3 + 1}"
+
+
+def normalize_season(season):
+    """Accept '2' as well as 'Season_2'."""
+    season = season.strip()
+    return f"Season_{season}" if season.isdigit() else season
+
+
+class SeasonalTips:
+    def __init__(self):
+        self._tips = None
+        self._lock = threading.Lock()
+        # Separate from _lock, which is held while the first load runs
+        self._stats_lock = threading.Lock()
+        self._stats = {"loads": 0, "served": 0, "load_errors": 0}
 
+    def _count(self, key):
+        with self._stats_lock:
+            self._stats[key] += 1
+
+    def load(self):
+        with db_pool.connection() as conn:
+            cursor = conn.cursor()
+            db_pool.execute_prepared(
+                cursor,
+                "maintenance_tips_all",
+                "SELECT season, part_name, failure_probability FROM maintenance_tips ORDER BY season, failure_probability DESC"
+            )
+            rows = cursor.fetchall()
+            cursor.close()
+        tips = {}
+        for season, part_name, probability in rows:
+            tips.setdefault(season, []).append({'part_name': part_name, 'failure_probability': probability})
+        # Replacing the dict is atomic, so requests see either the old or the new tips
+        self._tips = tips
+        self._count("loads")
+
+    def refresh(self, name=None, version=None):
+        """Reload the tips; signature matches DataVersionWatcher callbacks."""
+        try:
+            self.load()
+        except Exception as e:
+            self._count("load_errors")
+            print(f"maintenance tips reload failed: {e}")
+
+    def get(self, season):
+        if self._tips is None:
+            with self._lock:
+                if self._tips is None:
+                    self.load()
+        self._count("served")
+        return self._tips.get(season, [])
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        tips = self._tips
+        stats["loaded"] = tips is not None
+        if tips is not None:
+            stats["seasons"] = sorted(tips)
+        return stats
+
+
+seasonal_tips = SeasonalTips()
+data_versions.subscribe(("maintenance_tips",), seasonal_tips.refresh)
+
+
+@tips_bp.route('/api/maintenance_tips', methods=['GET'])
+def get_maintenance_tips():
+    """Get maintenance tips for a season (the current quarter by default)."""
+    season = normalize_season(request.args.get('season') or current_season())
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        # Query the maintenance tips for the specified season
-        cursor.execute(
-            "SELECT part_name, failure_probability FROM maintenance_tips WHERE season = %s ORDER BY failure_probability DESC;",
-            (season,)
-        )
-        tips = cursor.fetchall()
-        conn.close()
-
-        # Convert query results to JSON
-        result = [{'part_name': row[0], 'failure_probability': row[1]} for row in tips]
-        return jsonify(result)
+        return jsonify(seasonal_tips.get(season))
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+
 if __name__ == '__main__':
+    app = Flask(__name__)
+    app.register_blueprint(tips_bp)
+
+    @app.route('/api/metrics', methods=['GET'])
+    def get_metrics():
+        """Runtime metrics of the tips service."""
+        return jsonify({'db_pool': db_pool.pool_stats(), 'maintenance_tips': seasonal_tips.stats()})
+
+    seasonal_tips.refresh()
+    data_versions.start()
     app.run(host='0.0.0.0', port=5001, debug=True)
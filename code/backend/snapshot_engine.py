@@ -0,0 +1,251 @@
+"""
+In-memory recommendation engine over a columnar snapshot of the business table.
+
+The snapshot holds NumPy arrays for coordinates, stars, best_business labels, the
+per-business embeddings and (for composite ranking) the per-fault composite scores, so
+fault filters, nearest-shop lookups and cosine similarity run without a database round trip. It is reloaded in the background when the data
+versions change and swapped in atomically; while it is stale the caller falls back to SQL.
+"""
+
+import os
+import threading
+import time
+
+import numpy as np
+import psycopg2.extras
+
+import db_pool
+
+SNAPSHOT_MAX_AGE = float(os.getenv("SNAPSHOT_MAX_AGE", "86400"))
+EARTH_RADIUS_M = 6371008.8
+
+
+class BusinessSnapshot:
+    def __init__(self, rows, versions, score_rows=None):
+        self.versions = versions
+        self.loaded_at = time.time()
+        self.business_ids = np.array([r["business_id"] for r in rows], dtype=object)
+        self.names = [r["name"] for r in rows]
+        self.addresses = [r["address"] for r in rows]
+        self.geoms = [r["geom"] for r in rows]
+        self.stars = np.array([r["stars"] if r["stars"] is not None else np.nan for r in rows], dtype=np.float64)
+        self.faults = np.array([r["best_business"] for r in rows], dtype=object)
+        self.lat = np.radians(np.array([r["lat"] if r["lat"] is not None else np.nan for r in rows], dtype=np.float64))
+        self.lon = np.radians(np.array([r["lon"] if r["lon"] is not None else np.nan for r in rows], dtype=np.float64))
+
+        # Unit-length embedding rows so cosine similarity is a single matrix-vector product
+        with_embedding = [i for i, r in enumerate(rows) if r["embedding"]]
+        self.embedding_index = np.array(with_embedding, dtype=np.int64)
+        if with_embedding:
+            matrix = np.array(
+                [rows[i]["embedding"][1:-1].split(",") for i in with_embedding], dtype=np.float32
+            )
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            self.embeddings = matrix / np.where(norms == 0, 1, norms)
+        else:
+            self.embeddings = None
+
+        # fault_type -> (business indices, composite scores), in descending score order like the top-k index
+        self.fault_scores = None
+        if score_rows is not None:
+            position = {business_id: i for i, business_id in enumerate(self.business_ids)}
+            by_fault = {}
+            for r in score_rows:
+                i = position.get(r["business_id"])
+                if i is not None:
+                    by_fault.setdefault(r["fault_type"], ([], []))
+                    by_fault[r["fault_type"]][0].append(i)
+                    by_fault[r["fault_type"]][1].append(r["composite_score"])
+            self.fault_scores = {
+                fault: (np.array(indices, dtype=np.int64), np.array(scores, dtype=np.float64))
+                for fault, (indices, scores) in by_fault.items()
+            }
+
+    def __len__(self):
+        return len(self.business_ids)
+
+    def distances(self, user_lat, user_lon):
+        """
+        Haversine distance in metres from the user to every business (NaN without coordinates).
+        """
+        lat, lon = np.radians(user_lat), np.radians(user_lon)
+        a = (np.sin((self.lat - lat) / 2) ** 2
+             + np.cos(lat) * np.cos(self.lat) * np.sin((self.lon - lon) / 2) ** 2)
+        return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+    def fault_candidates(self, fault_id):
+        """
+        Candidate indices and their composite scores (None when ranking by rating).
+        """
+        if self.fault_scores is None:
+            return np.flatnonzero(self.faults == fault_id), None
+        empty = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64))
+        return self.fault_scores.get(fault_id, empty)
+
+    def similar_candidates(self, query_vector, limit):
+        query = np.asarray(query_vector, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1)
+        scores = self.embeddings @ query
+        top = np.argpartition(-scores, min(limit, len(scores)) - 1)[:limit]
+        top = top[np.argsort(-scores[top])]
+        return self.embedding_index[top]
+
+    def business(self, i, distance=None):
+        item = {
+            "name": self.names[i],
+            "stars": None if np.isnan(self.stars[i]) else float(self.stars[i]),
+            "address": self.addresses[i],
+            "geom": self.geoms[i],
+        }
+        if distance is not None:
+            item["distance"] = float(distance)
+        return item
+
+    def rank(self, candidates, ranking, user_lat=None, user_lon=None, radius_m=None, scores=None):
+        """
+        Same ranking as the SQL paths: with a location, score the nearest candidates by quality
+        and closeness; otherwise keep the highest quality. Quality is the rating out of 5, or the
+        composite score relative to the best nearby candidate when scores are given.
+        """
+        limit = ranking["result_limit"]
+        if len(candidates) == 0:
+            return []
+        if scores is None:
+            quality = np.nan_to_num(self.stars[candidates], nan=0.0) / 5.0
+        else:
+            quality = np.asarray(scores, dtype=np.float64)
+        if user_lat is None or user_lon is None:
+            order = np.argsort(-quality, kind="stable")[:limit]
+            return [self.business(candidates[i]) for i in order]
+
+        distance = self.distances(user_lat, user_lon)[candidates]
+        keep = ~np.isnan(distance)
+        if radius_m is not None:
+            keep &= distance <= radius_m
+        candidates, quality, distance = candidates[keep], quality[keep], distance[keep]
+        nearest = np.argsort(distance, kind="stable")[:ranking["spatial_candidates"]]
+        candidates, quality, distance = candidates[nearest], quality[nearest], distance[nearest]
+        if scores is not None:
+            best = quality.max() if len(quality) else 0
+            quality = quality / best if best > 0 else np.zeros_like(quality)
+
+        scale = radius_m or ranking["distance_scale_m"]
+        score = (ranking["rating_weight"] * quality
+                 + ranking["distance_weight"] * (1 - np.minimum(distance / scale, 1)))
+        order = np.lexsort((distance, -score))[:limit]
+        return [self.business(candidates[i], distance[i]) for i in order]
+
+
+class SnapshotEngine:
+    def __init__(self, datasets, fault_ranking="best_business", max_age=SNAPSHOT_MAX_AGE):
+        self.datasets = tuple(datasets)
+        self.fault_ranking = fault_ranking
+        self.max_age = max_age
+        self._snapshot = None
+        self._reload_requested = threading.Event()
+        self._reload_lock = threading.Lock()
+        self._reloading = False
+        self._stats = {"served": 0, "fallbacks": 0, "reloads": 0, "reload_errors": 0}
+
+    def load(self, versions):
+        with db_pool.connection() as conn:
+            cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+            cur.execute("""
+                SELECT b.business_id, b.name, b.stars, b.address, b.best_business,
+                       ST_Y(b.geom::geometry) AS lat, ST_X(b.geom::geometry) AS lon,
+                       ST_AsGeoJSON(b.geom) AS geom,
+                       e.embedding::text AS embedding
+                FROM business b
+                LEFT JOIN business_embeddings e ON e.business_id = b.business_id
+            """)
+            rows = cur.fetchall()
+            score_rows = None
+            # Without the scores table, fault searches rank by best_business like the SQL fallback
+            if self.fault_ranking == "composite" and self._has_scores_table(cur):
+                cur.execute("""
+                    SELECT business_id, fault_type, composite_score
+                    FROM business_fault_scores
+                    ORDER BY fault_type, composite_score DESC
+                """)
+                score_rows = cur.fetchall()
+            cur.close()
+        # Swapping the reference is atomic, so readers see either the old or the new snapshot
+        self._snapshot = BusinessSnapshot(rows, versions, score_rows)
+        self._stats["reloads"] += 1
+
+    @staticmethod
+    def _has_scores_table(cur):
+        cur.execute("SELECT to_regclass('business_fault_scores') IS NOT NULL AS ready")
+        return cur.fetchone()["ready"]
+
+    def request_reload(self, versions_fn):
+        """
+        Reload in a background thread; repeated requests while a reload runs are coalesced.
+        versions_fn returns the current data versions and is read right before loading.
+        """
+        self._reload_requested.set()
+        with self._reload_lock:
+            if self._reloading:
+                return
+            self._reloading = True
+        threading.Thread(target=self._reload_loop, args=(versions_fn,), name="snapshot-reload", daemon=True).start()
+
+    def _reload_loop(self, versions_fn):
+        done = False
+        try:
+            while not done:
+                while self._reload_requested.is_set():
+                    self._reload_requested.clear()
+                    try:
+                        self.load(versions_fn())
+                    except Exception as e:
+                        self._stats["reload_errors"] += 1
+                        print(f"snapshot reload failed: {e}")
+                # A request made after the last check returned early because _reloading was
+                # still set, so check again under the lock before handing the role back
+                with self._reload_lock:
+                    done = not self._reload_requested.is_set()
+                    if done:
+                        self._reloading = False
+        finally:
+            if not done:
+                with self._reload_lock:
+                    self._reloading = False
+
+    def current(self, versions):
+        """
+        The snapshot if it matches the given data versions and is not too old, else None.
+        """
+        snapshot = self._snapshot
+        if snapshot is None or snapshot.versions != versions:
+            return None
+        if time.time() - snapshot.loaded_at > self.max_age:
+            return None
+        return snapshot
+
+    def recommend(self, versions, ranking, fault_id=None, query_vector=None,
+                  user_lat=None, user_lon=None, radius_m=None):
+        """
+        Ranked businesses from memory, or None when the caller should fall back to SQL.
+        """
+        snapshot = self.current(versions)
+        if snapshot is None or (fault_id is None and snapshot.embeddings is None):
+            self._stats["fallbacks"] += 1
+            return None
+        scores = None
+        if fault_id is not None:
+            candidates, scores = snapshot.fault_candidates(fault_id)
+        else:
+            candidates = snapshot.similar_candidates(query_vector, ranking["similar_business_limit"])
+        self._stats["served"] += 1
+        return snapshot.rank(candidates, ranking, user_lat, user_lon, radius_m, scores)
+
+    def stats(self):
+        stats = dict(self._stats)
+        snapshot = self._snapshot
+        stats["loaded"] = snapshot is not None
+        if snapshot is not None:
+            stats["businesses"] = len(snapshot)
+            stats["age_seconds"] = time.time() - snapshot.loaded_at
+            stats["versions"] = list(snapshot.versions)
+        return stats
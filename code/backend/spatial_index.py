@@ -0,0 +1,49 @@
+"""
+Prepare business.geom for KNN nearest-shop queries.
+
+Usage:
+    python code/backend/spatial_index.py
+
+Stores geom as geography (metres, great-circle distance) and builds the GiST index
+that `geom <-> point` ordering and ST_DWithin radius filters use.
+"""
+
+import psycopg2
+
+import db_pool
+
+INDEX_NAME = "business_geom_gist_idx"
+
+
+def build_spatial_index():
+    conn = psycopg2.connect(**db_pool.DB_CONFIG)
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    conn.autocommit = True
+    cur = conn.cursor()
+    try:
+        # DB_CONFIG carries the request statement_timeout; the column rewrite and index build take longer
+        cur.execute("SET statement_timeout = 0")
+        cur.execute("""
+            SELECT udt_name FROM information_schema.columns
+            WHERE table_name = 'business' AND column_name = 'geom'
+        """)
+        row = cur.fetchone()
+        if row is None:
+            raise RuntimeError("business.geom does not exist")
+        if row[0] == "geometry":
+            print("Converting business.geom from geometry to geography...")
+            cur.execute("""
+                ALTER TABLE business
+                ALTER COLUMN geom TYPE geography(Point, 4326)
+                USING ST_SetSRID(geom, 4326)::geography
+            """)
+        cur.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {INDEX_NAME} ON business USING gist (geom)")
+        cur.execute("ANALYZE business")
+        print(f"Spatial index {INDEX_NAME} is ready.")
+    finally:
+        cur.close()
+        conn.close()
+
+
+if __name__ == "__main__":
+    build_spatial_index()
@@ -0,0 +1,155 @@
+"""
+Manage the approximate nearest neighbour index on reviews.embedding.
+
+Usage:
+    python code/backend/vector_index.py build --method hnsw --m 16 --ef-construction 64
+    python code/backend/vector_index.py build --method ivfflat --lists 200
+    python code/backend/vector_index.py benchmark --queries 50 --k 100
+
+The index uses cosine distance (vector_cosine_ops), so queries must order by `embedding <=> vector`.
+"""
+
+import argparse
+import time
+
+import psycopg2
+
+import db_pool
+
+INDEX_NAME = "reviews_embedding_ann_idx"
+
+# Query-time recall/speed knob of each index method
+SEARCH_SETTINGS = {
+    "hnsw": "hnsw.ef_search",
+    "ivfflat": "ivfflat.probes",
+}
+
+
+def search_settings(ef_search=None, probes=None, limit=None):
+    """
+    (setting, value) pairs for the ANN recall/speed knobs.
+    An HNSW scan returns at most ef_search rows, so ef_search is raised to the query's LIMIT when given.
+    """
+    settings = []
+    if ef_search is not None:
+        if limit is not None:
+            ef_search = max(int(ef_search), int(limit))
+        settings.append((SEARCH_SETTINGS["hnsw"], str(int(ef_search))))
+    if probes is not None:
+        settings.append((SEARCH_SETTINGS["ivfflat"], str(int(probes))))
+    return settings
+
+
+def apply_search_settings(cur, ef_search=None, probes=None, limit=None):
+    """
+    Set the ANN recall/speed knobs for the current transaction only.
+    """
+    for setting, value in search_settings(ef_search, probes, limit):
+        cur.execute("SELECT set_config(%s, %s, true)", (setting, value))
+
+
+def build_index(method, m=16, ef_construction=64, lists=None, maintenance_work_mem="1GB"):
+    """
+    (Re)build the ANN index without blocking writes to reviews.
+    """
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction, so use a dedicated autocommit connection
+    conn = psycopg2.connect(**db_pool.DB_CONFIG)
+    conn.autocommit = True
+    cur = conn.cursor()
+    try:
+        # DB_CONFIG carries the request statement_timeout; an index build takes much longer
+        cur.execute("SET statement_timeout = 0")
+        cur.execute("CREATE EXTENSION IF NOT EXISTS vector")
+        cur.execute("SET maintenance_work_mem = %s", (maintenance_work_mem,))
+        if method == "hnsw":
+            with_clause = f"m = {int(m)}, ef_construction = {int(ef_construction)}"
+        else:
+            if lists is None:
+                # pgvector guideline: rows / 1000 lists for up to 1M rows
+                cur.execute("SELECT count(*) FROM reviews WHERE embedding IS NOT NULL")
+                lists = max(cur.fetchone()[0] // 1000, 1)
+            with_clause = f"lists = {int(lists)}"
+
+        start = time.perf_counter()
+        cur.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {INDEX_NAME}")
+        cur.execute(f"""
+            CREATE INDEX CONCURRENTLY {INDEX_NAME}
+            ON reviews USING {method} (embedding vector_cosine_ops)
+            WITH ({with_clause})
+        """)
+        print(f"Built {method} index {INDEX_NAME} ({with_clause}) in {time.perf_counter() - start:.1f}s")
+    finally:
+        cur.close()
+        conn.close()
+
+
+def nearest_review_ids(cur, vector, k):
+    cur.execute(
+        "SELECT review_id FROM reviews ORDER BY embedding <=> %s::vector LIMIT %s",
+        (vector, k)
+    )
+    return [row[0] for row in cur.fetchall()]
+
+
+def benchmark(method, values, n_queries=50, k=100):
+    """
+    Compare ANN results against the exact scan for each knob value and print recall@k and latency.
+    Query vectors are sampled from existing review embeddings.
+    """
+    setting = SEARCH_SETTINGS[method]
+    with db_pool.connection() as conn:
+        cur = conn.cursor()
+        # Sampling and exact scans run well past the pool's request statement_timeout
+        cur.execute("SELECT set_config('statement_timeout', '0', true)")
+        cur.execute(
+            "SELECT embedding::text FROM reviews WHERE embedding IS NOT NULL ORDER BY random() LIMIT %s",
+            (n_queries,)
+        )
+        queries = [row[0] for row in cur.fetchall()]
+
+        # Ground truth: force a sequential scan
+        cur.execute("SELECT set_config('enable_indexscan', 'off', true)")
+        start = time.perf_counter()
+        exact = [set(nearest_review_ids(cur, q, k)) for q in queries]
+        exact_ms = (time.perf_counter() - start) * 1000 / len(queries)
+        cur.execute("SELECT set_config('enable_indexscan', 'on', true)")
+
+        print(f"exact scan: {exact_ms:.1f} ms/query")
+        print(f"{setting:>16} {'recall@' + str(k):>10} {'ms/query':>10}")
+        for value in values:
+            if method == "hnsw" and value < k:
+                # ef_search below k caps the result at ef_search rows, so recall could never reach 1
+                print(f"{value:>16} skipped: ef_search must be at least k={k}")
+                continue
+            cur.execute("SELECT set_config(%s, %s, true)", (setting, str(value)))
+            start = time.perf_counter()
+            approx = [nearest_review_ids(cur, q, k) for q in queries]
+            ann_ms = (time.perf_counter() - start) * 1000 / len(queries)
+            recall = sum(len(truth.intersection(found)) / k for truth, found in zip(exact, approx)) / len(queries)
+            print(f"{value:>16} {recall:>10.3f} {ann_ms:>10.1f}")
+        cur.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build and benchmark the reviews.embedding ANN index.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = subparsers.add_parser("build")
+    build_parser.add_argument("--method", choices=sorted(SEARCH_SETTINGS), default="hnsw")
+    build_parser.add_argument("--m", type=int, default=16)
+    build_parser.add_argument("--ef-construction", type=int, default=64)
+    build_parser.add_argument("--lists", type=int)
+    build_parser.add_argument("--maintenance-work-mem", default="1GB")
+
+    bench_parser = subparsers.add_parser("benchmark")
+    bench_parser.add_argument("--method", choices=sorted(SEARCH_SETTINGS), default="hnsw")
+    bench_parser.add_argument("--values", type=int, nargs="+", help="ef_search (hnsw) or probes (ivfflat) values to try")
+    bench_parser.add_argument("--queries", type=int, default=50)
+    bench_parser.add_argument("--k", type=int, default=100)
+
+    args = parser.parse_args()
+    if args.command == "build":
+        build_index(args.method, args.m, args.ef_construction, args.lists, args.maintenance_work_mem)
+    else:
+        default_values = {"hnsw": [args.k, args.k * 2, args.k * 4, args.k * 8], "ivfflat": [1, 5, 10, 20]}
+        benchmark(args.method, args.values or default_values[args.method], args.queries, args.k)
@@ -0,0 +1,70 @@
+"""
+Watch the data_version table so in-memory caches can be dropped after a nightly refresh.
+
+Batch jobs bump a named version with scripts/data_version.py; the backend polls the
+table in a background thread so request handlers never wait on it.
+"""
+
+import os
+import threading
+
+import db_pool
+
+DATA_VERSION_POLL_SECONDS = float(os.getenv("DATA_VERSION_POLL_SECONDS", "30"))
+
+
+class DataVersionWatcher:
+    def __init__(self, interval=DATA_VERSION_POLL_SECONDS):
+        self.interval = interval
+        self._versions = {}
+        self._subscribers = []
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+
+    def get(self, name):
+        """
+        Last seen version of a dataset (None until it has been read once).
+        """
+        return self._versions.get(name)
+
+    def subscribe(self, names, callback):
+        """
+        Call callback(name, version) whenever one of the named versions changes.
+        """
+        with self._lock:
+            self._subscribers.append((set(names), callback))
+
+    def poll(self):
+        with db_pool.connection() as conn:
+            cur = conn.cursor()
+            cur.execute("SELECT name, version FROM data_version")
+            rows = cur.fetchall()
+            cur.close()
+        with self._lock:
+            changed = [(name, version) for name, version in rows if self._versions.get(name) != version]
+            self._versions.update(rows)
+            subscribers = list(self._subscribers)
+        for name, version in changed:
+            for names, callback in subscribers:
+                if name in names:
+                    callback(name, version)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.poll()
+            except Exception as e:
+                print(f"data version poll failed: {e}")
+            self._stop.wait(self.interval)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="data-version-watcher", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+
+watcher = DataVersionWatcher()
@@ -20,15 +20,23 @@ st.title("Best Auto Repair📍")
 st.write("---")
 
 
+# The catalog rarely changes, so it is fetched once per TTL instead of on every rerun
+FAULT_PARTS_TTL = 300
+
+@st.cache_data(ttl=FAULT_PARTS_TTL, show_spinner=False)
+def fetch_fault_parts():
+    """
+    Fetch the fault parts list from the backend. Failures raise, so they are not cached.
+    """
+    response = requests.get(f"{API_BASE_URL}/api/fault-parts", timeout=10)
+    if response.status_code != 200:
+        raise RuntimeError(f"Failed to retrieve the list of fault parts. Status code: {response.status_code}")
+    return response.json().get("fault_parts", [])
+
 # Fetch fault parts list from the backend
 fault_parts = []
 try:
-    response = requests.get(f"{API_BASE_URL}/api/fault-parts")
-    if response.status_code == 200:
-        data = response.json()
-        fault_parts = data.get("fault_parts", [])
-    else:
-        st.error(f"Failed to retrieve the list of fault parts. Status code: {response.status_code}")
+    fault_parts = fetch_fault_parts()
 except Exception as e:
     st.error(f"Error while retrieving fault parts: {e}")
 
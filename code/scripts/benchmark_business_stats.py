@@ -0,0 +1,91 @@
+"""
+Benchmark the per-business loop against the vectorized pandas path in newcol_bussiness.py
+on synthetic reviews, and check that both give identical frames.
+
+    python benchmark_business_stats.py --sizes 10000 100000 1000000
+"""
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from newcol_bussiness import (
+    process_fault_counts,
+    build_business_stats,
+    build_business_stats_vectorized,
+    merge_and_update_diff,
+    merge_and_update_diff_vectorized,
+)
+
+FAULT_TYPES = [
+    "brake", "engine", "transmission", "battery", "tire", "suspension", "exhaust",
+    "air conditioning", "alternator", "radiator", "oil change", "steering",
+]
+# Share of reviews the tagger leaves without a fault_type
+UNTAGGED_SHARE = 0.3
+REVIEWS_PER_BUSINESS = 25
+
+
+def synthetic_data(n_reviews, seed=0):
+    """
+    Reviews with skewed fault types over n_reviews / REVIEWS_PER_BUSINESS businesses, plus a business
+    table where some shops have no reviews and half already carry statistics from an earlier run.
+    """
+    rng = np.random.default_rng(seed)
+    n_businesses = max(n_reviews // REVIEWS_PER_BUSINESS, 1)
+    business_ids = np.array([f"b{i:08d}" for i in range(n_businesses)], dtype=object)
+
+    weights = 1 / np.arange(1, len(FAULT_TYPES) + 1)
+    fault_types = rng.choice(np.array(FAULT_TYPES, dtype=object), size=n_reviews, p=weights / weights.sum())
+    fault_types[rng.random(n_reviews) < UNTAGGED_SHARE] = None
+    reviews_df = pd.DataFrame({
+        "business_id": rng.choice(business_ids, size=n_reviews),
+        "fault_type": fault_types,
+    })
+
+    extra_ids = np.array([f"x{i:08d}" for i in range(n_businesses // 10)], dtype=object)
+    all_ids = np.concatenate([business_ids, extra_ids])
+    previous = rng.random(len(all_ids)) < 0.5
+    business_df = pd.DataFrame({
+        "business_id": all_ids,
+        "name": [f"Shop {i}" for i in range(len(all_ids))],
+        "past_businesses": np.where(previous, "brake(1)", None),
+        "best_business": np.where(previous, "brake", None),
+    })
+    return reviews_df, business_df
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def run(n_reviews):
+    reviews_df, business_df = synthetic_data(n_reviews)
+    fault_counts = process_fault_counts(reviews_df)
+
+    stats_loop, loop_build = timed(build_business_stats, fault_counts)
+    stats_vec, vec_build = timed(build_business_stats_vectorized, fault_counts)
+    pd.testing.assert_frame_equal(stats_loop, stats_vec)
+
+    merged_loop, loop_merge = timed(merge_and_update_diff, business_df.copy(), stats_loop)
+    merged_vec, vec_merge = timed(merge_and_update_diff_vectorized, business_df.copy(), stats_vec)
+    pd.testing.assert_frame_equal(merged_loop, merged_vec)
+
+    loop_total, vec_total = loop_build + loop_merge, vec_build + vec_merge
+    print(f"{n_reviews:>9} {loop_build:>9.3f} {vec_build:>9.3f} {loop_merge:>9.3f} {vec_merge:>9.3f} "
+          f"{loop_total / vec_total:>8.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark loop vs vectorized business statistics.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000],
+                        help="numbers of synthetic reviews")
+    args = parser.parse_args()
+
+    print(f"{'reviews':>9} {'loop s':>9} {'vec s':>9} {'merge s':>9} {'vmerge s':>9} {'speed-up':>9}")
+    for size in args.sizes:
+        run(size)
@@ -0,0 +1,112 @@
+"""
+Per-business embeddings: the centroid (mean) of each business's review embeddings.
+
+Semantic search over these few thousand vectors replaces the search over every review vector.
+Run this script for a full rebuild; embedding.py folds each chunk of new review embeddings into
+the stored centroids in the same transaction that writes the chunk.
+"""
+
+import os
+import numpy as np
+from sqlalchemy import create_engine, text
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DATABASE_URI = f"postgresql+psycopg2://{os.getenv('DB_USER')}:{os.getenv('DB_PASSWORD')}@" \
+               f"{os.getenv('DB_HOST')}:{os.getenv('DB_PORT')}/{os.getenv('DB_NAME')}"
+engine = create_engine(DATABASE_URI)
+
+create_table_sql = text("""
+CREATE TABLE IF NOT EXISTS business_embeddings (
+    business_id VARCHAR(255) PRIMARY KEY,
+    embedding vector(384) NOT NULL,
+    n_reviews INTEGER NOT NULL,
+    updated_at TIMESTAMP DEFAULT now()
+);
+CREATE INDEX IF NOT EXISTS business_embeddings_hnsw_idx
+ON business_embeddings USING hnsw (embedding vector_cosine_ops);
+CREATE INDEX IF NOT EXISTS reviews_business_id_idx ON reviews (business_id);
+""")
+
+centroid_sql = """
+INSERT INTO business_embeddings (business_id, embedding, n_reviews, updated_at)
+SELECT business_id, AVG(embedding), COUNT(*), now()
+FROM reviews
+WHERE embedding IS NOT NULL {filter}
+GROUP BY business_id
+ON CONFLICT (business_id) DO UPDATE
+SET embedding = EXCLUDED.embedding,
+    n_reviews = EXCLUDED.n_reviews,
+    updated_at = now()
+"""
+
+
+def refresh_business_embeddings(conn, business_ids=None):
+    """
+    Recompute centroids on an open SQLAlchemy connection, only for business_ids if given.
+    """
+    conn.execute(create_table_sql)
+    if business_ids is None:
+        conn.execute(text(centroid_sql.format(filter="")))
+    else:
+        conn.execute(
+            text(centroid_sql.format(filter="AND business_id = ANY(:business_ids)")),
+            {"business_ids": list(business_ids)}
+        )
+
+
+def fold_business_embeddings(conn, business_ids, embeddings):
+    """
+    Add newly embedded reviews to the stored centroids on an open SQLAlchemy connection:
+    new = (old * n + sum of the k new vectors) / (n + k). Each review must be folded in only once,
+    after it was written to reviews. Businesses without a centroid yet are averaged from reviews.
+    """
+    sums = {}
+    counts = {}
+    for business_id, embedding in zip(business_ids, embeddings):
+        if business_id in sums:
+            sums[business_id] += embedding
+            counts[business_id] += 1
+        else:
+            sums[business_id] = np.asarray(embedding, dtype=np.float64).copy()
+            counts[business_id] = 1
+    if not sums:
+        return
+
+    # Row locks keep concurrent runs from folding into the same old centroid
+    rows = conn.execute(text("""
+        SELECT business_id, embedding::real[], n_reviews
+        FROM business_embeddings
+        WHERE business_id = ANY(:business_ids)
+        FOR UPDATE
+    """), {"business_ids": list(sums)}).fetchall()
+    for business_id, old_embedding, n_reviews in rows:
+        sums[business_id] += np.asarray(old_embedding, dtype=np.float64) * n_reviews
+        counts[business_id] += n_reviews
+    missing = set(sums) - {row[0] for row in rows}
+    if missing:
+        refresh_business_embeddings(conn, missing)
+        for business_id in missing:
+            del sums[business_id]
+    if not sums:
+        return
+
+    conn.execute(text("""
+        INSERT INTO business_embeddings (business_id, embedding, n_reviews, updated_at)
+        VALUES (:business_id, :embedding, :n_reviews, now())
+        ON CONFLICT (business_id) DO UPDATE
+        SET embedding = EXCLUDED.embedding,
+            n_reviews = EXCLUDED.n_reviews,
+            updated_at = now()
+    """), [
+        {"business_id": business_id, "embedding": (total / counts[business_id]).tolist(),
+         "n_reviews": counts[business_id]}
+        for business_id, total in sums.items()
+    ])
+
+
+if __name__ == "__main__":
+    with engine.begin() as conn:
+        refresh_business_embeddings(conn)
+    print("Business embeddings rebuilt.")
@@ -0,0 +1,76 @@
+"""
+Composite score per (business, fault_type): log(1 + repair_count) * avg_rating.
+
+The scores live in the business_fault_scores summary table, indexed for the top-k shops of a
+fault, and /api/recommend ranks fault searches by them. Run this script for a full rebuild;
+reviewdata_sort.py refreshes only the businesses whose reviews it just tagged.
+"""
+
+import os
+from sqlalchemy import create_engine, text
+from dotenv import load_dotenv
+from data_version import bump_data_version
+
+load_dotenv()
+
+DATABASE_URI = f"postgresql+psycopg2://{os.getenv('DB_USER')}:{os.getenv('DB_PASSWORD')}@" \
+               f"{os.getenv('DB_HOST')}:{os.getenv('DB_PORT', '5432')}/{os.getenv('DB_NAME')}"
+engine = create_engine(DATABASE_URI)
+
+create_table_sql = text("""
+CREATE TABLE IF NOT EXISTS business_fault_scores (
+    business_id VARCHAR(255) NOT NULL,
+    fault_type TEXT NOT NULL,
+    repair_count INTEGER NOT NULL,
+    avg_rating DOUBLE PRECISION NOT NULL,
+    composite_score DOUBLE PRECISION NOT NULL,
+    updated_at TIMESTAMP DEFAULT now(),
+    PRIMARY KEY (business_id, fault_type)
+);
+CREATE INDEX IF NOT EXISTS business_fault_scores_topk_idx
+ON business_fault_scores (fault_type, composite_score DESC);
+""")
+
+# Businesses without a rating get the mean rating, as calculate_score.py used to do in pandas
+scores_sql = """
+INSERT INTO business_fault_scores (business_id, fault_type, repair_count, avg_rating, composite_score, updated_at)
+SELECT r.business_id, f.fault_type, COUNT(*),
+       COALESCE(b.stars, m.mean_stars),
+       LN(1 + COUNT(*)) * COALESCE(b.stars, m.mean_stars),
+       now()
+FROM review_faults f
+JOIN reviews r ON r.review_id = f.review_id
+JOIN business b ON b.business_id = r.business_id
+CROSS JOIN (SELECT AVG(stars) AS mean_stars FROM business) m
+WHERE b.name IS NOT NULL {filter}
+GROUP BY r.business_id, f.fault_type, b.stars, m.mean_stars
+"""
+
+
+def refresh_composite_scores(conn, business_ids=None):
+    """
+    Recompute scores on an open SQLAlchemy connection, only for business_ids if given.
+    Old rows are replaced in the same transaction, so readers keep seeing the previous scores until commit.
+    """
+    conn.execute(create_table_sql)
+    if business_ids is None:
+        conn.execute(text("DELETE FROM business_fault_scores"))
+        conn.execute(text(scores_sql.format(filter="")))
+    else:
+        params = {"business_ids": list(business_ids)}
+        conn.execute(text("DELETE FROM business_fault_scores WHERE business_id = ANY(:business_ids)"), params)
+        conn.execute(text(scores_sql.format(filter="AND r.business_id = ANY(:business_ids)")), params)
+
+
+def update_composite_scores(business_ids=None):
+    """
+    Refresh the scores (all businesses if business_ids is None) and bump the composite_scores data version.
+    """
+    with engine.begin() as conn:
+        refresh_composite_scores(conn, business_ids)
+        bump_data_version(conn, "composite_scores")
+
+
+if __name__ == "__main__":
+    update_composite_scores()
+    print("Composite scores rebuilt.")
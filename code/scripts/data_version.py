@@ -0,0 +1,30 @@
+"""
+Bump a named data version after a batch job changes data the backend caches
+(backend/version_watcher.py polls the table). Used by the scripts here and by the
+batch jobs in code/backend.
+"""
+
+create_table_sql = """
+CREATE TABLE IF NOT EXISTS data_version (
+    name TEXT PRIMARY KEY,
+    version BIGINT NOT NULL,
+    updated_at TIMESTAMP DEFAULT now()
+)
+"""
+
+bump_sql = """
+INSERT INTO data_version (name, version, updated_at) VALUES (%s, 1, now())
+ON CONFLICT (name) DO UPDATE
+SET version = data_version.version + 1,
+    updated_at = now()
+"""
+
+
+def bump_data_version(conn, name):
+    """
+    Increment the version of a dataset, on an open SQLAlchemy connection or a psycopg2 cursor.
+    """
+    # exec_driver_sql hands the statement to psycopg2 unchanged, so both take the same SQL
+    execute = getattr(conn, "exec_driver_sql", None) or conn.execute
+    execute(create_table_sql)
+    execute(bump_sql, (name,))
@@ -1,55 +1,237 @@
+import io
 import os
+import struct
+import time
+import argparse
+from functools import lru_cache
+import numpy as np
 import pandas as pd
 from sqlalchemy import create_engine, text
 from sentence_transformers import SentenceTransformer
 from dotenv import load_dotenv
 from tqdm import tqdm
+from business_embeddings import create_table_sql as create_business_embeddings_sql, fold_business_embeddings
+from data_version import bump_data_version
 
 load_dotenv()
 
 DATABASE_URI = f"postgresql+psycopg2://{os.getenv('DB_USER')}:{os.getenv('DB_PASSWORD')}@" \
                f"{os.getenv('DB_HOST')}:{os.getenv('DB_PORT')}/{os.getenv('DB_NAME')}"
 engine = create_engine(DATABASE_URI)
-model = SentenceTransformer("all-MiniLM-L6-v2")
+ENCODE_BATCH_SIZE = 64
+STREAM_CHUNK_SIZE = 2000
 
 def get_unembedded_reviews():
     query = text("""
-    SELECT review_id, text
+    SELECT review_id, business_id, text
     FROM reviews
     WHERE embedding IS NULL
     """)
     with engine.connect() as conn:
         rows = conn.execute(query).fetchall()
-    return pd.DataFrame(rows, columns=["review_id", "text"])
-
-def generate_embeddings(df):
-    embeddings = []
-    for txt in tqdm(df["text"], desc="Generating embeddings"):
-        vector = model.encode(txt)
-        embeddings.append(vector.tolist())
-    df["embedding"] = embeddings
+    return pd.DataFrame(rows, columns=["review_id", "business_id", "text"])
+
+@lru_cache(maxsize=None)
+def get_model():
+    # Loaded on first use so --help and empty runs do not pay for it
+    return SentenceTransformer("all-MiniLM-L6-v2")
+
+def ensure_unembedded_index():
+    """
+    Partial index so each keyset page only touches reviews that still need an embedding,
+    plus the business_embeddings table the chunks are folded into.
+    """
+    with engine.begin() as conn:
+        conn.execute(create_business_embeddings_sql)
+        conn.execute(text("""
+        CREATE INDEX IF NOT EXISTS reviews_unembedded_idx
+        ON reviews (review_id)
+        WHERE embedding IS NULL
+        """))
+
+def iter_unembedded_chunks(chunk_size=STREAM_CHUNK_SIZE, after_id=""):
+    """
+    Yield DataFrames of at most chunk_size unembedded reviews, paginated by review_id.
+    Rows committed by earlier chunks (or earlier runs) are no longer NULL, so a restarted
+    run picks up exactly where the previous one stopped.
+    """
+    query = text("""
+    SELECT review_id, business_id, text
+    FROM reviews
+    WHERE embedding IS NULL AND review_id > :after_id
+    ORDER BY review_id
+    LIMIT :limit
+    """)
+    last_id = after_id
+    while True:
+        with engine.connect() as conn:
+            rows = conn.execute(query, {"after_id": last_id, "limit": chunk_size}).fetchall()
+        if not rows:
+            return
+        last_id = rows[-1][0]
+        yield pd.DataFrame(rows, columns=["review_id", "business_id", "text"])
+
+def encode_texts(texts, batch_size=ENCODE_BATCH_SIZE, sort_by_length=True, pool=None):
+    """
+    Encode a list of texts into a float32 array of shape (len(texts), dim).
+    With sort_by_length, texts of similar length are batched together to cut padding,
+    and the rows are put back in the original order afterwards.
+    pool is an optional SentenceTransformer multi-process pool.
+    """
+    texts = list(texts)
+    if not texts:
+        return np.empty((0, get_model().get_sentence_embedding_dimension()), dtype=np.float32)
+
+    order = np.argsort([len(t) for t in texts], kind="stable") if sort_by_length else np.arange(len(texts))
+    sorted_texts = [texts[i] for i in order]
+
+    start = time.perf_counter()
+    if pool is not None:
+        vectors = get_model().encode_multi_process(sorted_texts, pool, batch_size=batch_size)
+    else:
+        vectors = get_model().encode(
+            sorted_texts,
+            batch_size=batch_size,
+            convert_to_numpy=True,
+            show_progress_bar=True
+        )
+    elapsed = time.perf_counter() - start
+    print(f"Encoded {len(texts)} reviews in {elapsed:.1f}s ({len(texts) / max(elapsed, 1e-9):.1f} reviews/sec)")
+
+    embeddings = np.empty_like(vectors, dtype=np.float32)
+    embeddings[order] = vectors
+    return embeddings
+
+def generate_embeddings(df, batch_size=ENCODE_BATCH_SIZE, sort_by_length=True, pool=None):
+    embeddings = encode_texts(df["text"].tolist(), batch_size, sort_by_length, pool)
+    # Keep one float32 row per review; conversion happens only when writing to the database
+    df["embedding"] = list(embeddings)
     return df
 
-def save_embeddings_to_db(df, batch_size=1000):
+def save_embeddings_to_db(conn, df, batch_size=1000):
+    """
+    Write the embeddings with executemany UPDATEs inside the caller's transaction.
+    """
     update_sql = text("""
     UPDATE reviews
     SET embedding = :embedding
     WHERE review_id = :review_id
     """)
-    with engine.connect() as conn:
-        with conn.begin():
-            for start in tqdm(range(0, len(df), batch_size), desc="Saving embeddings to DB"):
-                batch = df.iloc[start:start+batch_size]
-                params = batch[["review_id", "embedding"]].to_dict(orient="records")
-                conn.execute(update_sql, params)
+    start_time = time.perf_counter()
+    for start in tqdm(range(0, len(df), batch_size), desc="Saving embeddings to DB"):
+        batch = df.iloc[start:start+batch_size]
+        params = [
+            {"review_id": review_id, "embedding": embedding.tolist()}
+            for review_id, embedding in zip(batch["review_id"], batch["embedding"])
+        ]
+        conn.execute(update_sql, params)
+    report_write_rate("update", len(df), time.perf_counter() - start_time)
 
-if __name__ == "__main__":
-    reviews = get_unembedded_reviews()
-    if reviews.empty:
-        print("No new reviews to process.")
-    else:
-        reviews = generate_embeddings(reviews)
-        save_embeddings_to_db(reviews)
-        print("Embeddings updated.")
+def report_write_rate(mode, rows, elapsed):
+    print(f"Saved {rows} embeddings with {mode} in {elapsed:.1f}s ({rows / max(elapsed, 1e-9):.1f} rows/sec)")
+
+# PostgreSQL binary COPY framing: signature, flags, header extension length / end-of-data marker
+COPY_HEADER = b"PGCOPY\n\xff\r\n\x00" + struct.pack(">ii", 0, 0)
+COPY_TRAILER = struct.pack(">h", -1)
+
+def build_binary_copy(review_ids, embeddings):
+    """
+    Encode (review_id, embedding) rows in COPY binary format.
+    The vector field uses pgvector's wire format: int16 dim, int16 unused, dim big-endian float4.
+    """
+    buffer = io.BytesIO()
+    buffer.write(COPY_HEADER)
+    for review_id, embedding in zip(review_ids, embeddings):
+        review_id = review_id.encode("utf-8")
+        vector = np.asarray(embedding, dtype=">f4")
+        buffer.write(struct.pack(">hi", 2, len(review_id)))
+        buffer.write(review_id)
+        buffer.write(struct.pack(">ihh", 4 + vector.nbytes, len(vector), 0))
+        buffer.write(vector.tobytes())
+    buffer.write(COPY_TRAILER)
+    buffer.seek(0)
+    return buffer
+
+def save_embeddings_copy(conn, df):
+    """
+    Bulk write path: COPY the vectors in binary into a temp staging table,
+    then apply them with a single UPDATE ... FROM join, inside the caller's transaction.
+    """
+    start_time = time.perf_counter()
+    # COPY needs the psycopg2 cursor under the SQLAlchemy connection
+    cur = conn.connection.cursor()
+    cur.execute("""
+    CREATE TEMP TABLE embedding_staging (
+        review_id VARCHAR(255) PRIMARY KEY,
+        embedding vector
+    ) ON COMMIT DROP
+    """)
+    cur.copy_expert(
+        "COPY embedding_staging (review_id, embedding) FROM STDIN WITH (FORMAT binary)",
+        build_binary_copy(df["review_id"], df["embedding"])
+    )
+    cur.execute("""
+    UPDATE reviews r
+    SET embedding = s.embedding
+    FROM embedding_staging s
+    WHERE r.review_id = s.review_id
+    """)
+    cur.close()
+    report_write_rate("copy", len(df), time.perf_counter() - start_time)
+
+WRITERS = {"update": save_embeddings_to_db, "copy": save_embeddings_copy}
 
+def commit_embeddings(df, write=save_embeddings_to_db):
+    """
+    Write a batch of embeddings, fold them into the business centroids and bump the
+    embeddings data version in one transaction, so a crash never leaves stale centroids.
+    """
+    with engine.begin() as conn:
+        write(conn, df)
+        fold_business_embeddings(conn, df["business_id"], df["embedding"])
+        bump_data_version(conn, "embeddings")
+
+def stream_embeddings(chunk_size=STREAM_CHUNK_SIZE, batch_size=ENCODE_BATCH_SIZE, sort_by_length=True, pool=None,
+                      write=save_embeddings_to_db):
+    """
+    Embed and commit one chunk at a time, so memory stays flat and a crash only loses the current chunk.
+    Each chunk is folded into the business centroids in its own transaction.
+    """
+    ensure_unembedded_index()
+    total = 0
+    for chunk in iter_unembedded_chunks(chunk_size):
+        chunk = generate_embeddings(chunk, batch_size, sort_by_length, pool)
+        commit_embeddings(chunk, write)
+        total += len(chunk)
+        print(f"Committed {total} embeddings (last review_id {chunk['review_id'].iloc[-1]})")
+    return total
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Embed reviews that have no embedding yet.")
+    parser.add_argument("--batch-size", type=int, default=ENCODE_BATCH_SIZE)
+    parser.add_argument("--no-sort", action="store_true", help="disable length-sorted batching")
+    parser.add_argument("--multi-process", action="store_true", help="encode with one worker per CPU core")
+    parser.add_argument("--stream", action="store_true", help="embed and commit in keyset-paginated chunks")
+    parser.add_argument("--chunk-size", type=int, default=STREAM_CHUNK_SIZE)
+    parser.add_argument("--write-mode", choices=sorted(WRITERS), default="update",
+                        help="update: executemany UPDATE; copy: binary COPY into a staging table")
+    args = parser.parse_args()
 
+    pool = get_model().start_multi_process_pool(["cpu"] * os.cpu_count()) if args.multi_process else None
+    try:
+        if args.stream:
+            total = stream_embeddings(args.chunk_size, args.batch_size, not args.no_sort, pool,
+                                      WRITERS[args.write_mode])
+            print(f"Embeddings updated for {total} reviews." if total else "No new reviews to process.")
+        else:
+            ensure_unembedded_index()
+            reviews = get_unembedded_reviews()
+            if reviews.empty:
+                print("No new reviews to process.")
+            else:
+                reviews = generate_embeddings(reviews, args.batch_size, not args.no_sort, pool)
+                commit_embeddings(reviews, WRITERS[args.write_mode])
+                print("Embeddings updated.")
+    finally:
+        if pool is not None:
+            get_model().stop_multi_process_pool(pool)
@@ -0,0 +1,90 @@
+"""
+Quarterly fault rollup: fault_quarter_counts(business_id, fault_type, year, quarter, n).
+
+n is the number of review_faults rows of a business and fault in that quarter. The seasonal
+analytics (seasonal_trends.py, fault_maintenance_frequency.py, seasonal_tips.py) read this
+table instead of grouping the whole reviews table. reviewdata_sort.py keeps it up to date
+while tagging, by applying the review_faults rows it deletes and inserts as deltas; run this
+script for a full rebuild.
+"""
+
+import os
+from sqlalchemy import create_engine, text
+from dotenv import load_dotenv
+from data_version import bump_data_version
+
+load_dotenv()
+
+DATABASE_URI = f"postgresql+psycopg2://{os.getenv('DB_USER')}:{os.getenv('DB_PASSWORD')}@" \
+               f"{os.getenv('DB_HOST')}:{os.getenv('DB_PORT', '5432')}/{os.getenv('DB_NAME')}"
+engine = create_engine(DATABASE_URI)
+
+create_table_query = """
+CREATE TABLE IF NOT EXISTS fault_quarter_counts (
+    business_id VARCHAR(255) NOT NULL,
+    fault_type TEXT NOT NULL,
+    year SMALLINT NOT NULL,
+    quarter SMALLINT NOT NULL,
+    n INTEGER NOT NULL,
+    PRIMARY KEY (business_id, fault_type, year, quarter)
+);
+CREATE INDEX IF NOT EXISTS fault_quarter_counts_fault_quarter_idx ON fault_quarter_counts (fault_type, quarter);
+"""
+
+rebuild_query = """
+DELETE FROM fault_quarter_counts;
+INSERT INTO fault_quarter_counts (business_id, fault_type, year, quarter, n)
+SELECT r.business_id, f.fault_type, EXTRACT(year FROM r.date), EXTRACT(quarter FROM r.date), COUNT(*)
+FROM review_faults f
+JOIN reviews r ON r.review_id = f.review_id
+WHERE r.date IS NOT NULL
+GROUP BY 1, 2, 3, 4;
+"""
+
+# Delta statements for reviewdata_sort.write_chunk. {changes} is a data-modifying statement on
+# review_faults that RETURNING review_id, fault_type; its rows are counted per quarter and
+# subtracted from (sign -1) or added to (sign 1) the rollup in the same statement.
+apply_delta_query = """
+WITH changed AS (
+    {changes}
+),
+delta AS (
+    SELECT r.business_id, c.fault_type,
+           EXTRACT(year FROM r.date) AS year, EXTRACT(quarter FROM r.date) AS quarter,
+           {sign} * COUNT(*) AS n
+    FROM changed c
+    JOIN reviews r ON r.review_id = c.review_id
+    WHERE r.date IS NOT NULL
+    GROUP BY 1, 2, 3, 4
+)
+INSERT INTO fault_quarter_counts (business_id, fault_type, year, quarter, n)
+SELECT business_id, fault_type, year, quarter, n FROM delta
+ON CONFLICT (business_id, fault_type, year, quarter) DO UPDATE
+SET n = fault_quarter_counts.n + EXCLUDED.n
+"""
+
+prune_query = "DELETE FROM fault_quarter_counts WHERE n <= 0"
+
+
+def ensure_fault_quarter_counts(cur):
+    """
+    Create the rollup on a psycopg2 cursor; a new table is filled from review_faults so that
+    later deltas start from the right totals.
+    """
+    cur.execute("SELECT to_regclass('fault_quarter_counts') IS NULL")
+    missing = cur.fetchone()[0]
+    cur.execute(create_table_query)
+    if missing:
+        cur.execute(rebuild_query)
+
+
+def rebuild_fault_quarter_counts():
+    with engine.begin() as conn:
+        conn.execute(text(create_table_query))
+        conn.execute(text(rebuild_query))
+        bump_data_version(conn, "fault_quarter_counts")
+
+
+if __name__ == "__main__":
+    rebuild_fault_quarter_counts()
+    print("fault_quarter_counts rebuilt.")
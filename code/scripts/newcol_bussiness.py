@@ -1,8 +1,12 @@
 import sqlalchemy
+import argparse
+import time
+import numpy as np
 import pandas as pd
 from sqlalchemy import create_engine, text
 import os
 from dotenv import load_dotenv
+from data_version import bump_data_version
 
 
 # Load
@@ -18,8 +22,20 @@ DB_PORT = os.getenv("DB_PORT", "5432")
 DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
 engine = create_engine(DATABASE_URL)
 
-def fetch_reviews():
-    return pd.read_sql("SELECT business_id, fault_type FROM reviews", con=engine)
+def fetch_fault_counts():
+    """
+    Count, per business, the reviews mentioning each fault_type, using the multi-label review_faults table.
+    Rows come sorted by fault_type (byte order, like Python) so ties for best_business break the same
+    way as in rebuild_business_stats_sql.
+    """
+    query = """
+    SELECT r.business_id, f.fault_type, COUNT(*) AS count
+    FROM review_faults f
+    JOIN reviews r ON r.review_id = f.review_id
+    GROUP BY r.business_id, f.fault_type
+    ORDER BY r.business_id, f.fault_type COLLATE "C"
+    """
+    return pd.read_sql(query, con=engine)
 
 
 # print("reviews_df head:")
@@ -71,6 +87,28 @@ def build_business_stats(fault_counts):
 
 
 
+def build_business_stats_vectorized(fault_counts):
+    """
+    Vectorized build_business_stats: same rows, same order and the same strings, without a Python loop per business.
+    Labels are joined in each business's input order and ties for best_business go to the first row, as in the loop.
+    """
+    if fault_counts.empty:
+        return pd.DataFrame(columns=["business_id", "past_businesses", "best_business"])
+
+    counts = fault_counts.reset_index(drop=True)
+    labels = counts["fault_type"].astype(str) + "(" + counts["count"].astype(str) + ")"
+    past_businesses = labels.groupby(counts["business_id"]).agg(",".join)
+    grouped = counts.groupby("business_id")
+    best_business = counts.loc[grouped["count"].idxmax().values, "fault_type"].values
+    no_fault_type = counts["fault_type"].isnull().groupby(counts["business_id"]).all().values
+
+    return pd.DataFrame({
+        "business_id": past_businesses.index,
+        "past_businesses": np.where(no_fault_type, "unknown", past_businesses.values),
+        "best_business": np.where(no_fault_type, "unknown", best_business),
+    })
+
+
 def fetch_business_table():
     """
    Read the 'business' table from the database and return a DataFrame.
@@ -127,56 +165,154 @@ def merge_and_update_diff(business_df, business_stats_df):
     return merged_df
 
 
+def merge_and_update_diff_vectorized(business_df, business_stats_df):
+    """
+    Vectorized merge_and_update_diff: take the new value wherever one exists, else keep the old one.
+    """
+    if "past_businesses" not in business_df.columns:
+        business_df["past_businesses"] = None
 
+    if "best_business" not in business_df.columns:
+        business_df["best_business"] = None
 
+    merged_df = business_df.merge(
+        business_stats_df,
+        on="business_id",
+        how="left",
+        suffixes=("", "_new")
+    )
 
+    for column in ["past_businesses", "best_business"]:
+        new = merged_df[f"{column}_new"]
+        # Where the new value equals the old one either choice is the same, so only nulls decide
+        merged_df[column] = np.where(new.notnull(), new, merged_df[column]).astype(object)
 
-def main():
-    """
-   Main function: Process data and generate updated business tables.
+    merged_df.drop(columns=["past_businesses_new", "best_business_new"], inplace=True)
 
-    """
-    global updated_business_df
-    reviews_df = fetch_reviews()
-    fault_counts = process_fault_counts(reviews_df)
-    business_stats_df = build_business_stats(fault_counts)
-    business_df = fetch_business_table()
+    return merged_df
 
-    updated_business_df = merge_and_update_diff(business_df, business_stats_df)
 
-    print(updated_business_df.head(50))
-    # print(updated_business_df.iloc[100:200])
 
-main()
 
 
 
-# Update the database: add the new columns past_businesses and best_business
-with engine.begin() as conn:
-    # Add the new columns if they do not exist
+# Set-based version of build_business_stats + merge_and_update_diff: the histogram string and the
+# most frequent fault_type (ties go to the first fault_type in byte order, as idxmax does on the
+# sorted counts) are computed per business and written only where they differ from the table.
+# Businesses without tagged reviews keep their current values, as in the pandas merge.
+rebuild_business_stats_query = text("""
+WITH counts AS (
+    SELECT r.business_id, f.fault_type, COUNT(*) AS n
+    FROM review_faults f
+    JOIN reviews r ON r.review_id = f.review_id
+    GROUP BY r.business_id, f.fault_type
+),
+ranked AS (
+    SELECT business_id, fault_type, n,
+           row_number() OVER (PARTITION BY business_id ORDER BY n DESC, fault_type COLLATE "C") AS rank
+    FROM counts
+),
+stats AS (
+    SELECT business_id,
+           string_agg(fault_type || '(' || n || ')', ',' ORDER BY fault_type COLLATE "C") AS past_businesses,
+           MAX(fault_type) FILTER (WHERE rank = 1) AS best_business
+    FROM ranked
+    GROUP BY business_id
+),
+updated AS (
+    UPDATE business b
+    SET past_businesses = s.past_businesses,
+        best_business = s.best_business
+    FROM stats s
+    WHERE b.business_id = s.business_id
+      AND (b.past_businesses IS DISTINCT FROM s.past_businesses
+           OR b.best_business IS DISTINCT FROM s.best_business)
+    RETURNING b.business_id
+)
+SELECT COUNT(*) FROM updated
+""")
+
+
+def add_business_stat_columns(conn):
     conn.execute(text("ALTER TABLE business ADD COLUMN IF NOT EXISTS past_businesses TEXT"))
     conn.execute(text("ALTER TABLE business ADD COLUMN IF NOT EXISTS best_business TEXT"))
 
-    # Batch update the database using a loop
-    for _, row in updated_business_df.iterrows():
-        conn.execute(
-            text("""
-                UPDATE business
-                SET past_businesses = :past_businesses,
-                    best_business = :best_business
-                WHERE business_id = :business_id
-            """),
-            {
-                "past_businesses": row["past_businesses"],
-                "best_business": row["best_business"],
-                "business_id": row["business_id"]
-            }
-        )
 
-print("Business table successfully updated with past_businesses and best_business!")
+def rebuild_business_stats_sql():
+    """
+    Recompute past_businesses and best_business in the database with a single statement.
+    Returns the number of businesses whose values changed.
+    """
+    with engine.begin() as conn:
+        add_business_stat_columns(conn)
+        changed = conn.execute(rebuild_business_stats_query).scalar()
+        # Nothing cached against the old statistics is stale if no row changed
+        if changed:
+            bump_data_version(conn, "business_stats")
+    return changed
+
 
+def update_business_stats_pandas(vectorized=True):
+    """
+    Build the statistics in pandas and update the table row by row.
+    vectorized=False runs the original per-business loop.
+    """
+    fault_counts = fetch_fault_counts()
+    business_df = fetch_business_table()
+    if vectorized:
+        business_stats_df = build_business_stats_vectorized(fault_counts)
+        updated_business_df = merge_and_update_diff_vectorized(business_df, business_stats_df)
+    else:
+        business_stats_df = build_business_stats(fault_counts)
+        updated_business_df = merge_and_update_diff(business_df, business_stats_df)
 
+    print(updated_business_df.head(50))
+    # print(updated_business_df.iloc[100:200])
 
+    # Update the database: add the new columns past_businesses and best_business
+    with engine.begin() as conn:
+        add_business_stat_columns(conn)
+
+        # Batch update the database using a loop
+        for _, row in updated_business_df.iterrows():
+            conn.execute(
+                text("""
+                    UPDATE business
+                    SET past_businesses = :past_businesses,
+                        best_business = :best_business
+                    WHERE business_id = :business_id
+                """),
+                {
+                    "past_businesses": row["past_businesses"],
+                    "best_business": row["best_business"],
+                    "business_id": row["business_id"]
+                }
+            )
+
+        # Let the backend drop recommendations cached against the old statistics
+        bump_data_version(conn, "business_stats")
 
 
+def main():
+    """
+   Main function: Process data and generate updated business tables.
 
+    """
+    parser = argparse.ArgumentParser(description="Rebuild past_businesses / best_business on the business table.")
+    parser.add_argument("--mode", choices=["sql", "pandas", "pandas-loop"], default="sql",
+                        help="sql: one set-based statement in the database; pandas: vectorized client-side path; "
+                             "pandas-loop: the original per-business loop")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    if args.mode == "sql":
+        changed = rebuild_business_stats_sql()
+        print(f"{changed} businesses changed")
+    else:
+        update_business_stats_pandas(vectorized=args.mode == "pandas")
+    print(f"Business table successfully updated with past_businesses and best_business! "
+          f"({time.perf_counter() - start:.1f}s, {args.mode})")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,11 @@
 import pandas as pd
-import json
+import csv
+import hashlib
+import io
 import psycopg2
 from dotenv import load_dotenv
 import os
+from yelp_scanner import scan_json_lines, review_prefilter
 
 # Load
 load_dotenv()
@@ -23,57 +26,144 @@ os.chdir(script_dir)
 business_id_file = "../data/auto_repair_businesses_PA_filtered.csv"
 review_file = "../data/yelp_academic_dataset_review.json"
 
+# Number of matching reviews sent per COPY (one transaction + checkpoint each)
+BATCH_SIZE = 5000
+# Bytes at the start of the file hashed into its fingerprint
+FINGERPRINT_BYTES = 1 << 20
+review_columns = ["review_id", "business_id", "stars", "text", "date"]
 
-# Read business_id file
-business_ids = pd.read_csv(business_id_file)["business_id"].tolist()
 
-# Connect to PostgreSQL
-try:
-    client = psycopg2.connect(**db_config)
+def load_business_index(path):
+    """
+    Read the filtered business_id file into a frozenset so each review lookup is O(1).
+    """
+    return frozenset(pd.read_csv(path)["business_id"])
+
+
+def file_fingerprint(path):
+    """
+    Size plus a hash of the first bytes, so a new dump saved under the same name is not
+    mistaken for the file an old checkpoint belongs to.
+    """
+    with open(path, "rb") as file:
+        head = hashlib.sha256(file.read(FINGERPRINT_BYTES)).hexdigest()
+    return f"{os.path.getsize(path)}:{head}"
+
+
+def load_checkpoint(cursor, source, fingerprint):
+    """
+    Return the byte offset already ingested for this source file (0 if it was never loaded,
+    or if the checkpoint was saved for a different file under the same name).
+    """
+    cursor.execute("SELECT byte_offset, fingerprint FROM ingest_checkpoint WHERE source = %s", (source,))
+    row = cursor.fetchone()
+    if row is None:
+        return 0
+    if row[1] != fingerprint:
+        print(f"{source} changed since its checkpoint, starting from the beginning")
+        return 0
+    return row[0]
+
+
+def save_checkpoint(cursor, source, fingerprint, byte_offset):
+    cursor.execute(
+        """
+        INSERT INTO ingest_checkpoint (source, fingerprint, byte_offset) VALUES (%s, %s, %s)
+        ON CONFLICT (source) DO UPDATE
+        SET fingerprint = EXCLUDED.fingerprint, byte_offset = EXCLUDED.byte_offset, updated_at = now()
+        """,
+        (source, fingerprint, byte_offset)
+    )
+
+
+def copy_reviews(cursor, rows):
+    """
+    Bulk load a batch of rows into the reviews table with COPY FROM STDIN.
+    """
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    buffer.seek(0)
+    cursor.copy_expert(
+        f"COPY reviews ({', '.join(review_columns)}) FROM STDIN WITH (FORMAT csv)",
+        buffer
+    )
+
+
+def ingest_reviews(client, path, business_ids, batch_size=BATCH_SIZE):
+    """
+    Load matching reviews in batches using the parallel scanner. Each batch and its checkpoint
+    are committed in one transaction, so an interrupted run resumes right after the last committed batch.
+    """
+    source = os.path.basename(path)
+    fingerprint = file_fingerprint(path)
     cursor = client.cursor()
-except Exception as e:
-    exit()
-
-create_table_query = """
-CREATE TABLE IF NOT EXISTS reviews (
-    review_id VARCHAR(255),
-    business_id VARCHAR(255),
-    stars INTEGER,
-    text TEXT,
-    date DATE
-);
-"""
-cursor.execute(create_table_query)
-client.commit()
-
-try:
-    with open(review_file, 'r') as f:
-        total_lines = sum(1 for _ in open(review_file, 'r'))  
-        f.seek(0)  
-        processed_lines = 0
-        for line in f:
-            review = json.loads(line)
-            processed_lines += 1
-            if review["business_id"] in business_ids:
-                for key in ["user_id", "useful", "funny", "cool"]:
-                    review.pop(key, None)
-                data = (
-                    review["review_id"],
-                    review["business_id"],
-                    review["stars"],
-                    review["text"],
-                    review["date"]
-                )
-                insert_query = """
-                    INSERT INTO reviews (review_id, business_id, stars, text, date)
-                    VALUES (%s, %s, %s, %s, %s)
-                """
-                cursor.execute(insert_query, data)
-            if processed_lines % 10000 == 0:
-        client.commit()
-except Exception as e:
-    client.rollback()
-finally:
+    start_offset = load_checkpoint(cursor, source, fingerprint)
+    if start_offset:
+        print(f"Resuming {source} from byte {start_offset}")
+
+    batch = []
+    inserted = 0
+    # Chunks come back in file order, so chunk_end is a safe resume point once its rows are committed
+    for chunk_end, reviews in scan_json_lines(path, prefilter=review_prefilter(business_ids),
+                                              start_offset=start_offset):
+        batch.extend(tuple(review[key] for key in review_columns) for review in reviews)
+        if len(batch) >= batch_size:
+            copy_reviews(cursor, batch)
+            save_checkpoint(cursor, source, fingerprint, chunk_end)
+            client.commit()
+            inserted += len(batch)
+            batch = []
+            print(f"inserted {inserted} reviews (byte {chunk_end})")
+
+    if batch:
+        copy_reviews(cursor, batch)
+        inserted += len(batch)
+    # Mark the whole file as done, including non-matching lines after the last match
+    save_checkpoint(cursor, source, fingerprint, os.path.getsize(path))
+    client.commit()
+    cursor.close()
+    return inserted
+
+
+def main():
+    # Read business_id file
+    business_ids = load_business_index(business_id_file)
+
+    # Connect to PostgreSQL
+    try:
+        client = psycopg2.connect(**db_config)
+        cursor = client.cursor()
+    except Exception as e:
+        exit()
+
+    create_table_query = """
+    CREATE TABLE IF NOT EXISTS reviews (
+        review_id VARCHAR(255),
+        business_id VARCHAR(255),
+        stars INTEGER,
+        text TEXT,
+        date DATE
+    );
+    CREATE TABLE IF NOT EXISTS ingest_checkpoint (
+        source TEXT PRIMARY KEY,
+        byte_offset BIGINT NOT NULL,
+        updated_at TIMESTAMP DEFAULT now()
+    );
+    ALTER TABLE ingest_checkpoint ADD COLUMN IF NOT EXISTS fingerprint TEXT;
+    """
+    cursor.execute(create_table_query)
+    client.commit()
     cursor.close()
-    client.close()
-    
+
+    try:
+        total = ingest_reviews(client, review_file, business_ids)
+        print(f"insert {total} reviews to reviews")
+    except Exception as e:
+        client.rollback()
+        print(f"error: {e}")
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    main()
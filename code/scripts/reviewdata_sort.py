@@ -1,15 +1,23 @@
 import psycopg2
+import psycopg2.extras
 from dotenv import load_dotenv
 import os
-import pandas as pd
+import csv
+import io
 import json
 import re
+import hashlib
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 from nltk.stem import PorterStemmer
 from nltk.corpus import stopwords
 import nltk
 from sqlalchemy import create_engine
-from sqlalchemy import text
 from flask import Flask, request, jsonify
+from composite_scores import update_composite_scores
+from data_version import bump_data_version
+from fault_rollup import ensure_fault_quarter_counts, apply_delta_query, prune_query
 
 load_dotenv()
 
@@ -37,6 +45,10 @@ except LookupError:
 # Initialize NLP tools
 stemmer = PorterStemmer()
 stop_words = set(stopwords.words("english"))
+non_letters = re.compile(r'[^a-zA-Z\s]')
+
+# Marks the end of a keyword in the trie; maps to the categories that keyword belongs to
+END = "$"
 
 # Load dictionary data from JSON file
 def load_fault_dict_from_json(json_path):
@@ -44,49 +56,346 @@ def load_fault_dict_from_json(json_path):
 
         return json.load(file)
 
-# Process dictionary data and apply stemming
-def process_fault_dict(fault_dict):
-    processed_dict = {}
+# Reviews repeat the same few thousand words, so each distinct word is stemmed only once
+@lru_cache(maxsize=None)
+def stem(word):
+    return stemmer.stem(word)
+
+def tokenize(text):
+    """
+    Lowercase, strip special characters, drop stop words and stem.
+    Keywords and reviews go through the same steps so their tokens line up.
+    """
+    text = non_letters.sub('', text.lower())
+    return [stem(word) for word in text.split() if word not in stop_words]
+
+# Process dictionary data into a token trie of stemmed keywords
+def build_fault_trie(fault_dict):
+    """
+    Compile every keyword (including multi-word ones like "brake pad") into a trie keyed by stemmed tokens.
+    Terminal nodes list the categories of the keyword, in dictionary order.
+    """
+    trie = {}
     for key, values in fault_dict.items():
-        processed_dict[key] = [stemmer.stem(value.lower()) for value in values]
-    return processed_dict
+        for value in values:
+            tokens = tokenize(value)
+            if not tokens:
+                continue
+            node = trie
+            for token in tokens:
+                node = node.setdefault(token, {})
+            categories = node.setdefault(END, [])
+            if key not in categories:
+                categories.append(key)
+    return trie
 
-# Define a function to extract fault type by matching stemmed keywords
-def extract_fault_type(text, processed_dict):
-    # Clean and stem input text
-    text = re.sub(r'[^a-zA-Z\s]', '', text.lower())  # Remove special characters
-    words = [stemmer.stem(word) for word in text.split() if word not in stop_words]
-
-    # Match stemmed keywords with processed dictionary
-    for key, values in processed_dict.items():
-        if any(word in values for word in words):
+def match_fault_categories(text, fault_trie):
+    """
+    Walk the trie from every token position in one pass over the review and
+    return a Counter of category -> number of keyword hits.
+    """
+    tokens = tokenize(text)
+    hits = Counter()
+    for i in range(len(tokens)):
+        node = fault_trie
+        matched = set()
+        for token in tokens[i:]:
+            node = node.get(token)
+            if node is None:
+                break
+            matched.update(node.get(END, ()))
+        # A position counts once per category, so "brake pad" is one brakes hit, not two
+        hits.update(matched)
+    return hits
+
+def primary_fault_type(hits, categories):
+    # Keep the first matching category in dictionary order
+    for key in categories:
+        if hits[key]:
             return key
     return None
 
+# Define a function to extract fault type by matching stemmed keywords
+def extract_fault_type(text, fault_trie, categories):
+    return primary_fault_type(match_fault_categories(text, fault_trie), categories)
+
+def fault_rows(review_ids, fault_hits):
+    """
+    Flatten per-review hit counters into (review_id, fault_type, hits) rows for review_faults.
+    """
+    return [
+        (review_id, fault_type, count)
+        for review_id, hits in zip(review_ids, fault_hits)
+        for fault_type, count in hits.items()
+    ]
+
+create_review_faults_query = """
+ALTER TABLE reviews ADD COLUMN IF NOT EXISTS fault_type TEXT;
+ALTER TABLE reviews ADD COLUMN IF NOT EXISTS fault_text_hash TEXT;
+ALTER TABLE reviews ADD COLUMN IF NOT EXISTS fault_dict_version TEXT;
+CREATE TABLE IF NOT EXISTS review_faults (
+    review_id VARCHAR(255) NOT NULL,
+    fault_type TEXT NOT NULL,
+    hits INTEGER NOT NULL,
+    PRIMARY KEY (review_id, fault_type)
+);
+CREATE INDEX IF NOT EXISTS review_faults_fault_type_idx ON review_faults (fault_type);
+CREATE INDEX IF NOT EXISTS reviews_review_id_idx ON reviews (review_id);
+CREATE TABLE IF NOT EXISTS fault_dict_versions (
+    version TEXT NOT NULL,
+    category TEXT NOT NULL,
+    category_hash TEXT NOT NULL,
+    PRIMARY KEY (version, category)
+);
+-- Businesses whose reviews were re-tagged but whose composite scores are not refreshed yet.
+-- Filled in each chunk's transaction and emptied only after the scores commit, so a run
+-- that fails halfway still refreshes them on the next run.
+CREATE TABLE IF NOT EXISTS composite_refresh_queue (
+    business_id VARCHAR(255) PRIMARY KEY
+);
+"""
+
+# Per-connection staging tables, emptied by every commit
+create_staging_query = """
+CREATE TEMP TABLE IF NOT EXISTS review_tag_staging (
+    review_id VARCHAR(255),
+    fault_type TEXT,
+    text_hash TEXT,
+    replaced TEXT[]
+) ON COMMIT DELETE ROWS;
+CREATE TEMP TABLE IF NOT EXISTS review_faults_staging (
+    review_id VARCHAR(255),
+    fault_type TEXT,
+    hits INTEGER
+) ON COMMIT DELETE ROWS;
+"""
+
+CHUNK_SIZE = 5000
+
+# Set in each worker process by init_worker
+worker_trie = None
+worker_categories = None
+worker_partial_tries = None
+
+def content_hash(data):
+    return hashlib.sha256(json.dumps(data, sort_keys=True).encode("utf-8")).hexdigest()
+
+def dictionary_version(fault_dict):
+    """
+    Content hash of the synonym dictionary, stored with each tagged review.
+    """
+    return content_hash(fault_dict)
+
+def category_hashes(fault_dict):
+    # Keyword order does not affect matching, so each list is hashed sorted
+    return {key: content_hash(sorted(values)) for key, values in fault_dict.items()}
+
+def changed_categories(old_hashes, new_hashes):
+    """
+    Categories that were added, removed, or whose synonym list differs between two dictionary versions.
+    """
+    return {key for key in set(old_hashes) | set(new_hashes) if old_hashes.get(key) != new_hashes.get(key)}
+
+def record_dictionary_version(cur, version, hashes):
+    psycopg2.extras.execute_values(
+        cur,
+        "INSERT INTO fault_dict_versions (version, category, category_hash) VALUES %s ON CONFLICT DO NOTHING",
+        [(version, key, value) for key, value in hashes.items()]
+    )
+
+def build_partial_tries(cur, version, fault_dict):
+    """
+    For every earlier dictionary version, find the categories that changed since then and
+    compile a trie of only those categories. Reviews tagged under that version with
+    unchanged text are re-evaluated against it instead of the full dictionary.
+    """
+    cur.execute(
+        "SELECT version, category, category_hash FROM fault_dict_versions WHERE version <> %s",
+        (version,)
+    )
+    old_versions = {}
+    for old_version, category, category_hash in cur.fetchall():
+        old_versions.setdefault(old_version, {})[category] = category_hash
+
+    new_hashes = category_hashes(fault_dict)
+    partial_tries = {}
+    for old_version, old_hashes in old_versions.items():
+        changed = changed_categories(old_hashes, new_hashes)
+        subset = {key: values for key, values in fault_dict.items() if key in changed}
+        partial_tries[old_version] = (changed, build_fault_trie(subset))
+    return partial_tries
+
+def init_worker(fault_trie, categories, partial_tries):
+    global worker_trie, worker_categories, worker_partial_tries
+    worker_trie = fault_trie
+    worker_categories = categories
+    worker_partial_tries = partial_tries
+
+def tag_chunk(rows):
+    """
+    Classify a chunk of stale reviews in a worker process.
+    Reviews with new or changed text are matched against the full dictionary; reviews whose
+    text is unchanged but whose dictionary version is known are only re-matched on the
+    categories that changed since that version.
+    Returns the per-review rows for reviews and the multi-label rows for review_faults.
+    """
+    review_ids = []
+    fault_hits = []
+    review_rows = []
+    for review_id, review_text, text_hash, tagged_text_hash, tagged_version, tagged_faults in rows:
+        partial = worker_partial_tries.get(tagged_version) if tagged_text_hash == text_hash else None
+        if partial is None:
+            hits = match_fault_categories(review_text or "", worker_trie)
+            replaced = None
+            all_hits = hits
+        else:
+            changed, partial_trie = partial
+            hits = match_fault_categories(review_text or "", partial_trie)
+            replaced = "{" + ",".join(sorted(changed)) + "}"
+            # Unchanged categories keep their stored hits when choosing the primary fault_type
+            all_hits = Counter({key: 1 for key in tagged_faults or [] if key not in changed})
+            all_hits.update(hits)
+        review_ids.append(review_id)
+        fault_hits.append(hits)
+        review_rows.append((review_id, primary_fault_type(all_hits, worker_categories), text_hash, replaced))
+    return review_rows, fault_rows(review_ids, fault_hits)
+
+def iter_stale_chunks(conn, version, chunk_size=CHUNK_SIZE):
+    """
+    Stream reviews that are untagged, whose text changed, or that were tagged with another
+    dictionary version, through a server-side cursor.
+    """
+    cur = conn.cursor(name="stale_reviews")
+    cur.itersize = chunk_size
+    cur.execute("""
+        SELECT r.review_id, r.text, md5(r.text), r.fault_text_hash, r.fault_dict_version,
+               ARRAY(SELECT f.fault_type FROM review_faults f WHERE f.review_id = r.review_id)
+        FROM reviews r
+        WHERE r.fault_dict_version IS DISTINCT FROM %s
+           OR r.fault_text_hash IS DISTINCT FROM md5(r.text)
+    """, (version,))
+    while True:
+        rows = cur.fetchmany(chunk_size)
+        if not rows:
+            break
+        yield rows
+    cur.close()
+
+def copy_rows(cur, table, rows):
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    buffer.seek(0)
+    cur.copy_expert(f"COPY {table} FROM STDIN WITH (FORMAT csv)", buffer)
+
+def write_chunk(conn, review_rows, fault_rows, version):
+    """
+    COPY one tagged chunk into the staging tables and apply it with set-based statements.
+    """
+    cur = conn.cursor()
+    copy_rows(cur, "review_tag_staging", review_rows)
+    copy_rows(cur, "review_faults_staging", fault_rows)
+    cur.execute("""
+        UPDATE reviews r
+        SET fault_type = s.fault_type,
+            fault_text_hash = s.text_hash,
+            fault_dict_version = %s
+        FROM review_tag_staging s
+        WHERE r.review_id = s.review_id
+    """, (version,))
+    # replaced is NULL for a full re-tag, otherwise the categories that were re-evaluated.
+    # Removed and added rows are applied to the fault_quarter_counts rollup in the same statements.
+    cur.execute(apply_delta_query.format(sign=-1, changes="""
+        DELETE FROM review_faults f
+        USING review_tag_staging s
+        WHERE f.review_id = s.review_id
+          AND (s.replaced IS NULL OR f.fault_type = ANY(s.replaced))
+        RETURNING f.review_id, f.fault_type
+    """))
+    cur.execute(apply_delta_query.format(sign=1, changes="""
+        INSERT INTO review_faults (review_id, fault_type, hits)
+        SELECT review_id, fault_type, hits FROM review_faults_staging
+        ON CONFLICT (review_id, fault_type) DO NOTHING
+        RETURNING review_id, fault_type
+    """))
+    cur.execute("""
+        INSERT INTO composite_refresh_queue (business_id)
+        SELECT DISTINCT r.business_id
+        FROM review_tag_staging s
+        JOIN reviews r ON r.review_id = s.review_id
+        ON CONFLICT (business_id) DO NOTHING
+    """)
+    conn.commit()
+    cur.close()
+
+def tag_reviews(fault_dict, chunk_size=CHUNK_SIZE, max_workers=None):
+    """
+    Tag every stale review chunk by chunk across a process pool, committing each chunk,
+    then refresh the composite scores of the businesses that were touched and publish
+    the updated quarterly rollup.
+    """
+    version = dictionary_version(fault_dict)
+    fault_trie = build_fault_trie(fault_dict)
+    categories = list(fault_dict)
+    max_workers = max_workers or os.cpu_count()
 
-json_path = "data/auto_parts_synonyms.json"  # Replace with the actual path
-fault_dict = load_fault_dict_from_json(json_path)
-processed_fault_dict = process_fault_dict(fault_dict)
+    read_conn = engine.raw_connection()
+    write_conn = engine.raw_connection()
+    try:
+        cur = write_conn.cursor()
+        cur.execute(create_review_faults_query)
+        ensure_fault_quarter_counts(cur)
+        cur.execute(create_staging_query)
+        record_dictionary_version(cur, version, category_hashes(fault_dict))
+        partial_tries = build_partial_tries(cur, version, fault_dict)
+        write_conn.commit()
+        cur.close()
 
-# Load review table
-reviews_df = pd.read_sql("SELECT review_id, business_id, text, date FROM reviews", con=engine)
+        tagged = 0
+        with ProcessPoolExecutor(max_workers, initializer=init_worker, initargs=(fault_trie, categories, partial_tries)) as executor:
+            # Bounded window of chunks in flight so review text is never fully loaded in memory
+            pending = deque()
+            for rows in iter_stale_chunks(read_conn, version, chunk_size):
+                pending.append(executor.submit(tag_chunk, rows))
+                if len(pending) >= max_workers * 2:
+                    review_rows, faults = pending.popleft().result()
+                    write_chunk(write_conn, review_rows, faults, version)
+                    tagged += len(review_rows)
+                    print(f"tagged {tagged} reviews")
+            while pending:
+                review_rows, faults = pending.popleft().result()
+                write_chunk(write_conn, review_rows, faults, version)
+                tagged += len(review_rows)
+                print(f"tagged {tagged} reviews")
 
-# Clean the text column and extract fault_type
-reviews_df["fault_type"] = reviews_df["text"].apply(lambda x: extract_fault_type(x, processed_fault_dict))
+        # Includes businesses left over from an earlier run that failed before this point
+        cur = write_conn.cursor()
+        cur.execute("SELECT business_id FROM composite_refresh_queue")
+        business_ids = [r[0] for r in cur.fetchall()]
+        write_conn.commit()
+        cur.close()
+        if business_ids:
+            update_composite_scores(business_ids)
+            print(f"composite scores refreshed for {len(business_ids)} businesses")
 
-# Print the first few rows of the dataset f (with the new column fault_type)
-# print(reviews_df.iloc[100:200])
-# Update database: add the new column fault_type
+            cur = write_conn.cursor()
+            cur.execute("DELETE FROM composite_refresh_queue WHERE business_id = ANY(%s)", (business_ids,))
+            write_conn.commit()
+            cur.close()
 
-with engine.begin() as conn:
-    # Ensure the SQL is a valid executable object
-    conn.execute(text("ALTER TABLE reviews ADD COLUMN IF NOT EXISTS fault_type TEXT"))
+            cur = write_conn.cursor()
+            cur.execute(prune_query)
+            write_conn.commit()
+            cur.close()
+            with engine.begin() as conn:
+                bump_data_version(conn, "fault_quarter_counts")
+        return tagged
+    finally:
+        read_conn.close()
+        write_conn.close()
 
-    # Batch update the database using a loop
-    for _, row in reviews_df.iterrows():
-        conn.execute(
-            text("UPDATE reviews SET fault_type = :fault_type WHERE review_id = :review_id"),
-            {"fault_type": row["fault_type"], "review_id": row["review_id"]}
-        )
 
-print("Reviews table updated with fault_type!")
\ No newline at end of file
+if __name__ == "__main__":
+    json_path = "data/auto_parts_synonyms.json"  # Replace with the actual path
+    fault_dict = load_fault_dict_from_json(json_path)
+    tagged = tag_reviews(fault_dict)
+    print(f"Reviews table updated with fault_type and review_faults for {tagged} reviews!")
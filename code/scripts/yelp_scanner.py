@@ -0,0 +1,123 @@
+"""
+Parallel scanner for the Yelp JSON-lines dumps.
+
+The file is split into byte ranges aligned on newlines and every range is scanned
+in a worker process. Each line is first checked with a cheap filter on the raw
+bytes, and only the survivors are decoded with json.loads.
+"""
+
+import json
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+CHUNK_SIZE = 64 * 1024 * 1024
+
+
+def chunk_ranges(path, chunk_size=CHUNK_SIZE, start_offset=0):
+    """
+    Split the file into (start, end) byte ranges, each ending right after a newline.
+    """
+    file_size = os.path.getsize(path)
+    ranges = []
+    with open(path, "rb") as f:
+        start = start_offset
+        while start < file_size:
+            f.seek(min(start + chunk_size, file_size))
+            f.readline()
+            end = min(f.tell(), file_size)
+            ranges.append((start, end))
+            start = end
+    return ranges
+
+
+def scan_chunk(path, start, end, prefilter=None, predicate=None):
+    """
+    Decode the lines of one byte range and return the matching records together with the range end.
+    """
+    with open(path, "rb") as f:
+        f.seek(start)
+        data = f.read(end - start)
+
+    records = []
+    for line in data.split(b"\n"):
+        if not line.strip():
+            continue
+        if prefilter is not None and not prefilter(line):
+            continue
+        record = json.loads(line)
+        if predicate is None or predicate(record):
+            records.append(record)
+    return end, records
+
+
+def scan_json_lines(path, prefilter=None, predicate=None, start_offset=0,
+                    chunk_size=CHUNK_SIZE, max_workers=None):
+    """
+    Yield (chunk_end, records) for each chunk of the file, in file order.
+
+    prefilter receives the raw bytes of a line and predicate the decoded dict; both
+    must be picklable (module-level functions or functools.partial of them).
+    chunk_end can be stored as a checkpoint: every line before it has been yielded.
+    """
+    max_workers = max_workers or os.cpu_count()
+    ranges = chunk_ranges(path, chunk_size, start_offset)
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        # Keep a bounded window of chunks in flight so results stay ordered and memory stays flat
+        pending = deque()
+        for start, end in ranges:
+            pending.append(executor.submit(scan_chunk, path, start, end, prefilter, predicate))
+            if len(pending) >= max_workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def iter_json_lines(path, prefilter=None, predicate=None, **kwargs):
+    """
+    Stream matching records one by one.
+    """
+    for _, records in scan_json_lines(path, prefilter, predicate, **kwargs):
+        yield from records
+
+
+# Raw-bytes prefilters
+
+def contains_all(needles, line):
+    return all(needle in line for needle in needles)
+
+
+def business_id_in(business_ids, line):
+    """
+    Read the business_id straight out of the raw line and check it against the index.
+    """
+    key = b'"business_id":"'
+    start = line.find(key)
+    if start == -1:
+        return False
+    start += len(key)
+    end = line.find(b'"', start)
+    return line[start:end].decode() in business_ids
+
+
+def business_prefilter(state, category):
+    return partial(contains_all, (f'"state":"{state}"'.encode(), category.encode()))
+
+
+def review_prefilter(business_ids):
+    return partial(business_id_in, frozenset(business_ids))
+
+
+# Decoded-record predicates
+
+def is_business_in(state, category, business):
+    return (
+        bool(business.get("categories")) and
+        category in business["categories"] and
+        business.get("state", "") == state
+    )
+
+
+def business_predicate(state, category):
+    return partial(is_business_in, state, category)
@@ -1,5 +1,9 @@
 #!/bin/bash
-# start Flask backend
-python code/backend/app.py &
+# start backend: Flask dev server by default, or the async ASGI app with SERVER_MODE=asgi
+if [ "$SERVER_MODE" = "asgi" ]; then
+    uvicorn asgi_app:app --app-dir code/backend --host 127.0.0.1 --port 5000 --workers "${ASGI_WORKERS:-2}" &
+else
+    python code/backend/app.py &
+fi
 # start Streamlit frontend
 streamlit run code/frontend/main.py --server.port=8080 --server.address=0.0.0.0